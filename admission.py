@@ -0,0 +1,130 @@
+"""
+Admission control for the media pipeline.
+
+Every media job passes three gates before it can use a scarce resource:
+
+- a memory budget, reserved for the whole job in proportion to the
+  recording's size (its Content-Length);
+- network slots, held while a recording is downloaded;
+- CPU slots, one per media worker process (see media_worker.run_media_job).
+
+Waiters are woken by priority, so audio-only jobs, which are cheap and
+finish quickly, go ahead of full video processing; within a priority they are
+served first come, first served. When the gates are backed up the job worker
+stops claiming media jobs, leaving them in the durable queue for other
+replicas instead of piling them up in this process.
+"""
+import os
+import heapq
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+
+# --- Configuration ---
+# Recordings downloaded at the same time.
+MEDIA_NETWORK_CONCURRENCY = int(os.getenv("MEDIA_NETWORK_CONCURRENCY", "4"))
+# Total recording size that may be in flight in this process at once.
+MEDIA_MEMORY_BUDGET_MB = int(os.getenv("MEDIA_MEMORY_BUDGET_MB", "2048"))
+# Size assumed for a recording whose Content-Length isn't known.
+MEDIA_DEFAULT_RECORDING_MB = int(os.getenv("MEDIA_DEFAULT_RECORDING_MB", "256"))
+
+# Lower values are served first.
+PRIORITY_AUDIO_ONLY = 0
+PRIORITY_VIDEO = 1
+
+
+class PrioritySemaphore:
+    """
+    An asyncio semaphore with weighted acquires whose waiters are woken in
+    (priority, arrival) order.
+
+    A waiter at the head of the line blocks those behind it until enough
+    capacity is free for it, so a large job can't be starved by a stream of
+    small ones. A single acquire never needs more than the full capacity.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.available = capacity
+        self._waiters = []
+        self._arrivals = itertools.count()
+
+    def waiting(self) -> int:
+        return sum(1 for *_, future in self._waiters if not future.done())
+
+    def saturated(self) -> bool:
+        return self.available <= 0 or self.waiting() > 0
+
+    async def acquire(self, weight: int = 1, priority: int = PRIORITY_VIDEO) -> int:
+        """
+        Waits for `weight` units of capacity.
+
+        Returns:
+            The weight actually taken (capped at the capacity), to pass to release().
+        """
+        weight = min(weight, self.capacity)
+        if self.available >= weight and not self.waiting():
+            self.available -= weight
+            return weight
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._arrivals), weight, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Capacity was handed over just as we were cancelled.
+                self.release(weight)
+            else:
+                self._wake()
+            raise
+        return weight
+
+    def release(self, weight: int = 1):
+        self.available = min(self.available + weight, self.capacity)
+        self._wake()
+
+    def _wake(self):
+        while self._waiters:
+            _, _, weight, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if self.available < weight:
+                return
+            heapq.heappop(self._waiters)
+            self.available -= weight
+            future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, weight: int = 1, priority: int = PRIORITY_VIDEO):
+        taken = await self.acquire(weight, priority)
+        try:
+            yield
+        finally:
+            self.release(taken)
+
+
+_network_slots = PrioritySemaphore(MEDIA_NETWORK_CONCURRENCY)
+_memory_budget = PrioritySemaphore(MEDIA_MEMORY_BUDGET_MB * 1024 * 1024)
+
+
+def job_priority(video_requested: bool) -> int:
+    return PRIORITY_VIDEO if video_requested else PRIORITY_AUDIO_ONLY
+
+
+def reserve_memory(recording_size: int, priority: int):
+    """Holds a share of the memory budget sized to the recording for the duration of the block."""
+    if not recording_size:
+        recording_size = MEDIA_DEFAULT_RECORDING_MB * 1024 * 1024
+    return _memory_budget.slot(recording_size, priority)
+
+
+def network_slot(priority: int):
+    """Holds one of the MEDIA_NETWORK_CONCURRENCY download slots for the duration of the block."""
+    return _network_slots.slot(1, priority)
+
+
+def has_capacity() -> bool:
+    """False while media jobs are already waiting for memory or the network, so no more should be taken on."""
+    return not (_memory_budget.saturated() or _network_slots.saturated())
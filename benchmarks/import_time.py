@@ -0,0 +1,80 @@
+"""
+Import-time budget check for the API process.
+
+Imports `main` in a fresh interpreter with `-X importtime` and fails if it
+takes longer than the budget, or if any module that should only be loaded on
+first use (the media, AWS, Nylas and Mongo driver stacks) is pulled in at
+import time. Run from the repository root:
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --budget-ms 800 --top 15
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+# Top-level packages that must stay out of `import main`.
+LAZY_MODULES = ("cv2", "numpy", "moviepy", "imageio_ffmpeg", "boto3", "botocore", "nylas", "motor", "pymongo", "bson")
+
+
+def measure(module: str) -> list:
+    """
+    Returns (cumulative_us, self_us, name) for every module imported by
+    `import module`, parsed from the interpreter's -X importtime report.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=os.getcwd(),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # Keep the name's indentation, which encodes the import depth.
+        imports.append((int(cumulative_us), int(self_us), name[1:].rstrip()))
+    return imports
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-ms", type=float, default=1500.0)
+    parser.add_argument("--top", type=int, default=10, help="How many of the slowest top-level imports to list.")
+    options = parser.parse_args(argv)
+
+    imports = measure(options.module)
+    module_index = next(index for index, (_, _, name) in enumerate(imports) if name == options.module)
+    total_ms = imports[module_index][0] / 1000
+
+    # A module is reported after everything it imports, each level indented
+    # by two more spaces; collect what `module` imports directly.
+    direct = []
+    for entry in reversed(imports[:module_index]):
+        depth = (len(entry[2]) - len(entry[2].lstrip())) // 2
+        if depth == 0:
+            break
+        if depth == 1:
+            direct.append(entry)
+    top_level = sorted(direct, reverse=True)
+    print(f"import {options.module}: {total_ms:.0f} ms (budget {options.budget_ms:.0f} ms)")
+    for cumulative, _, name in top_level[:options.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    loaded = sorted({name.strip().split(".")[0] for _, _, name in imports} & set(LAZY_MODULES))
+    failed = False
+    if loaded:
+        print(f"Loaded at import time but should be lazy: {', '.join(loaded)}")
+        failed = True
+    if total_ms > options.budget_ms:
+        print(f"Import time is over budget by {total_ms - options.budget_ms:.0f} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,286 @@
+"""
+Offline end-to-end benchmark of the media pipeline.
+
+Runs `tasks.process_available_media` against the local stand-ins in
+`benchmarks/stand_ins.py` on a synthetic meeting recording, and reports for
+every stage its wall time, throughput, peak RSS (of this process plus the
+media worker processes and ffmpeg) and event-loop lag.
+
+Usage, from the repository root:
+
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.pipeline --duration 300 --resolution 1280x720
+    python -m benchmarks.pipeline --save-baseline benchmarks/baseline.json
+    python -m benchmarks.pipeline --baseline benchmarks/baseline.json
+
+With --baseline the run exits non-zero if any stage's wall time, peak RSS or
+event-loop lag regressed by more than --tolerance.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import threading
+import statistics
+
+from benchmarks.stand_ins import (
+    generate_video, generate_transcript, install_stand_ins, MediaServer, FakeNylas
+)
+
+LOOP_LAG_INTERVAL_SECONDS = 0.02
+RSS_SAMPLE_INTERVAL_SECONDS = 0.05
+# Differences below these are noise, whatever the tolerance says.
+WALL_SECONDS_SLACK = 0.05
+LOOP_LAG_MS_SLACK = 5.0
+REGRESSION_METRICS = ("wall_seconds", "peak_rss_mb", "max_loop_lag_ms")
+
+
+class StageRecorder:
+    """
+    Collects the time intervals and bytes of each pipeline stage, together with
+    RSS and event-loop lag samples, so each stage can be summarised afterwards.
+
+    Stages that run concurrently with themselves (e.g. the screenshot uploads)
+    are measured by the union of their intervals, not the sum.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.intervals = {}
+        self.bytes = {}
+        self.rss_samples = []
+        self.lag_samples = []
+
+    def record(self, stage: str, started_at: float, finished_at: float, size: int = 0):
+        self.intervals.setdefault(stage, []).append((started_at, finished_at))
+        self.bytes[stage] = self.bytes.get(stage, 0) + (size or 0)
+
+    def timed(self, stage, func, size_of=None):
+        """Wraps an async function so each call is recorded under `stage`."""
+        async def wrapper(*args, **kwargs):
+            started_at = time.monotonic()
+            result = await func(*args, **kwargs)
+            self.record(stage, started_at, time.monotonic(), size_of(args, result) if size_of else 0)
+            return result
+        return wrapper
+
+    async def watch_loop_lag(self):
+        """Measures how late the event loop wakes up from a short sleep."""
+        while True:
+            expected = time.monotonic() + LOOP_LAG_INTERVAL_SECONDS
+            await asyncio.sleep(LOOP_LAG_INTERVAL_SECONDS)
+            now = time.monotonic()
+            self.lag_samples.append((now, max(now - expected, 0.0)))
+
+    def watch_rss(self, stop: threading.Event):
+        """Samples the RSS of this process and all its children, from a thread so loop stalls don't skew it."""
+        import psutil
+
+        process = psutil.Process()
+        while not stop.is_set():
+            rss = process.memory_info().rss
+            for child in process.children(recursive=True):
+                try:
+                    rss += child.memory_info().rss
+                except psutil.Error:
+                    pass
+            self.rss_samples.append((time.monotonic(), rss))
+            stop.wait(RSS_SAMPLE_INTERVAL_SECONDS)
+
+    def summary(self, video_seconds: float) -> dict:
+        results = {}
+        for stage, intervals in self.intervals.items():
+            merged = []
+            for start, end in sorted(intervals):
+                if merged and start <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            wall = sum(end - start for start, end in merged)
+
+            def within(t):
+                return any(start <= t <= end for start, end in merged)
+
+            rss = [value for t, value in self.rss_samples if within(t)]
+            lag = [value for t, value in self.lag_samples if within(t)]
+            stage_result = {
+                "calls": len(intervals),
+                "wall_seconds": round(wall, 4),
+                "peak_rss_mb": round(max(rss) / (1024 * 1024), 1) if rss else None,
+                "max_loop_lag_ms": round(max(lag) * 1000, 2) if lag else 0.0,
+            }
+            if self.bytes.get(stage):
+                stage_result["bytes"] = self.bytes[stage]
+                stage_result["mb_per_second"] = round(self.bytes[stage] / (1024 * 1024) / wall, 2) if wall else None
+            else:
+                # Video seconds processed per wall-clock second
+                stage_result["realtime_factor"] = round(video_seconds / wall, 2) if wall else None
+            results[stage] = stage_result
+        return results
+
+
+def instrument(recorder: StageRecorder, fake_nylas: FakeNylas):
+    """Swaps the pipeline's stage functions in `tasks` for timed wrappers around the stand-ins."""
+    import tasks
+
+    tasks.get_notetaker_media = recorder.timed("nylas_media_lookup", fake_nylas.get_notetaker_media)
+    tasks.download_json_content = recorder.timed("transcript_download", tasks.download_json_content)
+    tasks.store_transcript = recorder.timed("transcript_store", tasks.store_transcript)
+    tasks.download_file_to_path = recorder.timed(
+        "recording_download", tasks.download_file_to_path, size_of=lambda args, result: result[0]
+    )
+    tasks.upload_once = recorder.timed(
+        "s3_upload", tasks.upload_once, size_of=lambda args, result: os.path.getsize(args[1])
+    )
+
+    run_media_job = tasks.run_media_job
+
+    async def timed_media_job(func, *args, **kwargs):
+        return await recorder.timed(func.__name__, run_media_job)(func, *args, **kwargs)
+
+    tasks.run_media_job = timed_media_job
+    return tasks
+
+
+async def run_benchmark(recording_url: str, transcript_url: str, options) -> list:
+    """Runs the pipeline `options.runs` times in one event loop and returns each run's summary."""
+    recorder = StageRecorder()
+    tasks = instrument(recorder, FakeNylas(recording_url, transcript_url, options.nylas_latency_ms / 1000))
+    from database import init_database, register_notetaker, get_notetaker
+
+    init_database()
+
+    runs = []
+    for run in range(options.runs):
+        recorder.reset()
+        notetaker_id = f"bench-{run}-{time.monotonic_ns()}"
+        await register_notetaker(notetaker_id, "bench-grant", "https://meet.google.com/bench", True)
+
+        stop_rss = threading.Event()
+        rss_thread = threading.Thread(target=recorder.watch_rss, args=(stop_rss,), daemon=True)
+        rss_thread.start()
+        lag_task = asyncio.create_task(recorder.watch_loop_lag())
+        try:
+            await recorder.timed("total", tasks.process_available_media)(await get_notetaker(notetaker_id))
+        finally:
+            lag_task.cancel()
+            stop_rss.set()
+            rss_thread.join()
+        runs.append(recorder.summary(options.duration))
+        print(f"Run {run + 1}/{options.runs}: {runs[-1]['total']['wall_seconds']}s")
+    return runs
+
+
+def median_results(runs: list) -> dict:
+    """Per-stage, per-metric median across runs."""
+    results = {}
+    for stage in runs[0]:
+        stage_runs = [run[stage] for run in runs if stage in run]
+        results[stage] = {}
+        for metric, value in stage_runs[0].items():
+            values = [run[metric] for run in stage_runs if run.get(metric) is not None]
+            results[stage][metric] = statistics.median(values) if values else value
+    return results
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    slack = {"wall_seconds": WALL_SECONDS_SLACK, "max_loop_lag_ms": LOOP_LAG_MS_SLACK, "peak_rss_mb": 0.0}
+    for stage, baseline_metrics in baseline.get("stages", {}).items():
+        current = results.get(stage)
+        if current is None:
+            continue
+        for metric in REGRESSION_METRICS:
+            before, after = baseline_metrics.get(metric), current.get(metric)
+            if before is None or after is None:
+                continue
+            if after > before * (1 + tolerance) + slack[metric]:
+                regressions.append(f"{stage}.{metric}: {before} -> {after}")
+    return regressions
+
+
+def print_table(results: dict):
+    columns = ("calls", "wall_seconds", "mb_per_second", "realtime_factor", "peak_rss_mb", "max_loop_lag_ms")
+    print(f"{'stage':<22}" + "".join(f"{column:>17}" for column in columns))
+    for stage, metrics in results.items():
+        cells = "".join(f"{'-' if metrics.get(column) is None else metrics[column]:>17}" for column in columns)
+        print(f"{stage:<22}{cells}")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=int, default=120, help="Length of the synthetic recording in seconds.")
+    parser.add_argument("--resolution", default="1280x720", help="WIDTHxHEIGHT of the synthetic recording.")
+    parser.add_argument("--fps", type=int, default=25)
+    parser.add_argument("--keyframe-seconds", type=int, default=10, help="Keyframe spacing of the synthetic recording.")
+    parser.add_argument("--runs", type=int, default=3, help="Runs to take the median of.")
+    parser.add_argument("--nylas-latency-ms", type=float, default=50.0, help="Simulated Nylas API latency.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--save-baseline", help="Write the results as a baseline to this file.")
+    parser.add_argument("--baseline", help="Fail if any stage regressed against this baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression (0.25 = 25%%).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    options = parse_args(argv)
+    width, height = (int(value) for value in options.resolution.lower().split("x"))
+    work_dir = tempfile.mkdtemp(prefix="nylas-bench-")
+    s3_mock = install_stand_ins(work_dir)
+    try:
+        media_dir = os.path.join(work_dir, "media")
+        os.makedirs(media_dir)
+        print(f"Generating a {options.duration}s {width}x{height}@{options.fps} recording...")
+        generate_video(
+            os.path.join(media_dir, "recording.mp4"), options.duration, width, height, options.fps,
+            options.keyframe_seconds,
+        )
+        generate_transcript(os.path.join(media_dir, "transcript.json"), options.duration)
+
+        from media_worker import shutdown_media_worker
+
+        with MediaServer(media_dir) as server:
+            runs = asyncio.run(run_benchmark(server.url("recording.mp4"), server.url("transcript.json"), options))
+        shutdown_media_worker()
+
+        results = median_results(runs)
+        print_table(results)
+
+        report = {
+            "recording": {
+                "duration_seconds": options.duration,
+                "resolution": options.resolution,
+                "fps": options.fps,
+                "keyframe_seconds": options.keyframe_seconds,
+                "bytes": os.path.getsize(os.path.join(media_dir, "recording.mp4")),
+            },
+            "runs": options.runs,
+            "stages": results,
+        }
+        for path in filter(None, (options.output, options.save_baseline)):
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+
+        if options.baseline:
+            with open(options.baseline) as f:
+                regressions = find_regressions(results, json.load(f), options.tolerance)
+            if regressions:
+                print("Regressions against baseline:")
+                for regression in regressions:
+                    print(f"  {regression}")
+                return 1
+            print("No regressions against baseline.")
+        return 0
+    finally:
+        s3_mock.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
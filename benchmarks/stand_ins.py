@@ -0,0 +1,136 @@
+"""
+Local stand-ins for the services the media pipeline talks to.
+
+Nothing here touches the network: recordings and transcripts are served by a
+local HTTP server, S3 is moto's in-process mock, MongoDB is mongomock-motor,
+and the Nylas notetaker API is replaced by a fake that points at the local
+server. `install_stand_ins()` must run before the app creates its clients
+(`database.init_database()` and the first S3 or Nylas call), because it
+patches the classes those clients are built from.
+"""
+import os
+import json
+import asyncio
+import threading
+import subprocess
+from types import SimpleNamespace
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+BENCHMARK_BUCKET = "nylas-benchmark"
+BENCHMARK_REGION = "us-east-1"
+
+
+def generate_video(path: str, duration_seconds: int, width: int, height: int, fps: int, keyframe_seconds: int = 10) -> str:
+    """
+    Renders a synthetic meeting recording with ffmpeg's test sources: a moving
+    test pattern (so scene detection has something to find) and a sine tone
+    encoded as AAC, in an MP4 like the ones Nylas produces. Meeting recorders
+    use long GOPs, so the keyframe spacing is fixed at `keyframe_seconds`.
+    """
+    from imageio_ffmpeg import get_ffmpeg_exe
+
+    command = [
+        get_ffmpeg_exe(), "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate={fps}:duration={duration_seconds}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=48000:duration={duration_seconds}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p",
+        "-g", str(fps * keyframe_seconds), "-keyint_min", str(fps * keyframe_seconds), "-sc_threshold", "0",
+        "-c:a", "aac", "-b:a", "128k",
+        "-shortest", "-movflags", "+faststart",
+        path,
+    ]
+    subprocess.run(command, check=True)
+    return path
+
+
+def generate_transcript(path: str, duration_seconds: int, segment_seconds: int = 5) -> str:
+    """Writes a diarized transcript with one segment every `segment_seconds`."""
+    speakers = ["Alice", "Bob", "Carol"]
+    segments = [
+        {
+            "speaker": speakers[index % len(speakers)],
+            "start": start * 1000,
+            "end": min(start + segment_seconds, duration_seconds) * 1000,
+            "text": f"Segment {index}: let's review the quarterly roadmap and the open action items.",
+        }
+        for index, start in enumerate(range(0, duration_seconds, segment_seconds))
+    ]
+    with open(path, "w") as f:
+        json.dump({"object": "transcript", "type": "speaker_labelled", "transcript": segments}, f)
+    return path
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class MediaServer:
+    """Serves a directory over HTTP on a free localhost port, from a background thread."""
+
+    def __init__(self, directory: str):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), partial(_QuietHandler, directory=directory))
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def url(self, filename: str) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/{filename}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class FakeNylas:
+    """
+    Answers the notetaker media lookup the way the Nylas API does, with the
+    recording and transcript URLs pointing at the local media server.
+    """
+
+    def __init__(self, recording_url: str, transcript_url: str, latency_seconds: float = 0.0):
+        self.recording_url = recording_url
+        self.transcript_url = transcript_url
+        self.latency_seconds = latency_seconds
+
+    async def get_notetaker_media(self, grant_id: str, notetaker_id: str):
+        await asyncio.sleep(self.latency_seconds)
+        return SimpleNamespace(data=SimpleNamespace(
+            recording=SimpleNamespace(url=self.recording_url),
+            transcript=SimpleNamespace(url=self.transcript_url),
+        ))
+
+
+def install_stand_ins(work_dir: str):
+    """
+    Points the app's configuration at the stand-ins and starts the S3 mock.
+
+    Returns:
+        The started moto mock; call `.stop()` on it when the run is over.
+    """
+    # Set unconditionally so a developer's .env can never send benchmark traffic to real services.
+    os.environ.update({
+        "MONGO_DETAILS": "mongodb://benchmark",
+        "NYLAS_API_KEY": "benchmark",
+        "AWS_ACCESS_KEY_ID": "benchmark",
+        "AWS_SECRET_ACCESS_KEY": "benchmark",
+        "AWS_S3_BUCKET_NAME": BENCHMARK_BUCKET,
+        "AWS_REGION": BENCHMARK_REGION,
+        "MEDIA_WORK_DIR": os.path.join(work_dir, "pipeline"),
+    })
+
+    import boto3
+    import motor.motor_asyncio
+    from moto import mock_aws
+    from mongomock_motor import AsyncMongoMockClient
+
+    motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+
+    s3_mock = mock_aws()
+    s3_mock.start()
+    boto3.client("s3", region_name=BENCHMARK_REGION).create_bucket(Bucket=BENCHMARK_BUCKET)
+    return s3_mock
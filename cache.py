@@ -0,0 +1,39 @@
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    A small in-process LRU cache whose entries also expire after `ttl` seconds.
+
+    Not shared between processes or replicas, so it should only hold data
+    where being up to `ttl` seconds stale is acceptable.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        """Returns the cached value for `key`, or `default` if missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        """Caches `value`, evicting the least recently used entry if full."""
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """Drops `key` from the cache."""
+        self._entries.pop(key, None)
@@ -0,0 +1,283 @@
+import os
+import time
+import asyncio
+from nylas_api import list_events, find_calendar
+
+# --- Configuration ---
+# How far ahead upcoming events are cached and timed.
+CALENDAR_LOOKAHEAD_SECONDS = int(os.getenv("CALENDAR_LOOKAHEAD_SECONDS", str(24 * 3600)))
+# A full re-list of the lookahead window, which also slides the window forward.
+CALENDAR_FULL_SYNC_SECONDS = int(os.getenv("CALENDAR_FULL_SYNC_SECONDS", "3600"))
+# Polls for events changed since the last sync. Calendar webhooks normally
+# deliver changes sooner; this catches any that were missed.
+CALENDAR_INCREMENTAL_SYNC_SECONDS = int(os.getenv("CALENDAR_INCREMENTAL_SYNC_SECONDS", "300"))
+# The bot is dispatched this many seconds before the meeting starts.
+BOT_JOIN_LEAD_SECONDS = int(os.getenv("BOT_JOIN_LEAD_SECONDS", "60"))
+# Meetings that started up to this long ago still get a bot if they were missed.
+BOT_LATE_JOIN_SECONDS = int(os.getenv("BOT_LATE_JOIN_SECONDS", "300"))
+# A failed dispatch is retried with exponential backoff between these bounds,
+# until the meeting is past BOT_LATE_JOIN_SECONDS.
+DISPATCH_RETRY_BASE_SECONDS = 5
+DISPATCH_RETRY_MAX_SECONDS = 60
+# Overlap between incremental syncs, to tolerate clock skew with Nylas.
+SYNC_OVERLAP_SECONDS = 30
+# Maximum number of calendars listed at the same time across all grants.
+CALENDAR_MAX_CONCURRENT_SYNCS = int(os.getenv("CALENDAR_MAX_CONCURRENT_SYNCS", "10"))
+
+_sync_slots = asyncio.Semaphore(CALENDAR_MAX_CONCURRENT_SYNCS)
+
+# Live sync engines by grant ID, so calendar webhooks can reach them.
+_syncs = {}
+
+
+def _event_fields(event: dict):
+    """
+    Extracts what the scheduler needs from a Nylas event (as returned by the
+    API or delivered in a webhook).
+
+    Returns:
+        A dict with the event's title, start time and meeting URL, or None if
+        the event can't have a bot (cancelled, all-day or no conferencing link).
+    """
+    if event.get("status") == "cancelled":
+        return None
+    start_time = (event.get("when") or {}).get("start_time")
+    details = (event.get("conferencing") or {}).get("details") or {}
+    meet_url = details.get("url")
+    if not start_time or not meet_url:
+        return None
+    return {"title": event.get("title"), "start_time": start_time, "meet_url": meet_url}
+
+
+class CalendarSync:
+    """
+    Keeps a local cache of one calendar's upcoming meetings and dispatches the
+    bot to each one on a timer at its start time.
+
+    The cache is filled by a full listing of the lookahead window every
+    CALENDAR_FULL_SYNC_SECONDS and kept current between those by incremental
+    `updated_after` listings and calendar webhooks. A timer re-confirms its
+    meeting with Nylas before dispatching, since those can miss changes.
+    """
+
+    def __init__(self, grant_id: str, dispatch, calendar_id: str = "primary"):
+        """
+        Args:
+            grant_id: The Nylas grant whose calendar is synced.
+            dispatch: Async callable `dispatch(grant_id, event_id, meet_url, title)`
+                that sends the bot to a meeting.
+            calendar_id: The calendar to sync.
+        """
+        self.grant_id = grant_id
+        self.calendar_id = calendar_id
+        self.dispatch = dispatch
+        self.events = {}
+        self._timers = {}
+        self._dispatched = set()
+        self._last_sync_at = None
+        self._sync_requested = asyncio.Event()
+        self._full_sync_requested = False
+        # The calendar's real ID: webhooks carry it even for "primary".
+        self.resolved_calendar_id = None if calendar_id == "primary" else calendar_id
+
+    async def _list_events(self, query_params: dict) -> list:
+        """Lists events page by page, returning them as plain dicts."""
+        events, page_token = [], None
+        async with _sync_slots:
+            while True:
+                params = dict(query_params, calendar_id=self.calendar_id, expand_recurring=True)
+                if page_token:
+                    params["page_token"] = page_token
+                response = await list_events(self.grant_id, params)
+                events.extend(event.to_dict() for event in response.data)
+                page_token = response.next_cursor
+                if not page_token:
+                    return events
+
+    def _window(self) -> dict:
+        now = int(time.time())
+        return {"start": now - BOT_LATE_JOIN_SECONDS, "end": now + CALENDAR_LOOKAHEAD_SECONDS}
+
+    async def full_sync(self):
+        """Re-lists the whole lookahead window and replaces the cache."""
+        if self.resolved_calendar_id is None:
+            self.resolved_calendar_id = (await find_calendar(self.grant_id, self.calendar_id)).data.id
+        synced_at = int(time.time())
+        events = await self._list_events(self._window())
+
+        fresh_ids = set()
+        for event in events:
+            if self.apply_event(event):
+                fresh_ids.add(event["id"])
+        for event_id in set(self.events) - fresh_ids:
+            self.remove_event(event_id)
+        self._dispatched &= {event["id"] for event in events}
+
+        self._last_sync_at = synced_at
+        print(f"🗓️ Full calendar sync for {self.grant_id}: {len(self.events)} upcoming meetings cached.")
+
+    async def incremental_sync(self):
+        """Fetches only the events changed since the last sync."""
+        synced_at = int(time.time())
+        params = self._window()
+        params["updated_after"] = self._last_sync_at - SYNC_OVERLAP_SECONDS
+        # Cancelled events are needed here so their timers can be removed.
+        params["show_cancelled"] = True
+        for event in await self._list_events(params):
+            self.apply_event(event)
+        self._last_sync_at = synced_at
+
+    def apply_event(self, event: dict) -> bool:
+        """
+        Adds, updates or removes a single event in the cache and (re)schedules
+        its dispatch timer.
+
+        Returns:
+            True if the event is cached and scheduled.
+        """
+        event_id = event.get("id")
+        if event_id in self._dispatched:
+            return False
+        fields = _event_fields(event)
+        now = int(time.time())
+        if (
+            fields is None
+            or fields["start_time"] < now - BOT_LATE_JOIN_SECONDS
+            or fields["start_time"] > now + CALENDAR_LOOKAHEAD_SECONDS
+        ):
+            self.remove_event(event_id)
+            return False
+
+        if self.events.get(event_id) != fields:
+            self.events[event_id] = fields
+            self._schedule(event_id)
+        return True
+
+    def remove_event(self, event_id: str):
+        """Drops an event from the cache and cancels its timer."""
+        self.events.pop(event_id, None)
+        timer = self._timers.pop(event_id, None)
+        if timer:
+            timer.cancel()
+
+    def _schedule(self, event_id: str):
+        timer = self._timers.pop(event_id, None)
+        if timer:
+            timer.cancel()
+        self._timers[event_id] = asyncio.create_task(self._dispatch_on_time(event_id))
+
+    async def _dispatch_on_time(self, event_id: str, retry_delay: float = 0):
+        fields = self.events[event_id]
+        await asyncio.sleep(retry_delay or max(fields["start_time"] - BOT_JOIN_LEAD_SECONDS - time.time(), 0))
+        self._timers.pop(event_id, None)
+        self.events.pop(event_id, None)
+        self._dispatched.add(event_id)
+        try:
+            if not await self._confirm_event(event_id, fields):
+                # Moved or deleted without a webhook reaching us; incremental
+                # syncs can't see that, so a full sync picks up its new time.
+                print(f"🗓️ Event {event_id} is no longer at its cached time; not dispatching.")
+                self._dispatched.discard(event_id)
+                self._full_sync_requested = True
+                self.request_sync()
+                return
+            await self.dispatch(self.grant_id, event_id, fields["meet_url"], fields["title"])
+        except Exception as e:
+            # The dispatcher only raises when a retry can't send a second bot
+            # (see scheduler_service.dispatch_bot): let syncs and webhooks see
+            # the event again, and retry while the bot can still join.
+            self._dispatched.discard(event_id)
+            next_delay = min(max(retry_delay * 2, DISPATCH_RETRY_BASE_SECONDS), DISPATCH_RETRY_MAX_SECONDS)
+            if time.time() + next_delay > fields["start_time"] + BOT_LATE_JOIN_SECONDS:
+                print(f"❌ Failed to dispatch bot for event {event_id}, giving up: {e}")
+                return
+            print(f"⚠️ Failed to dispatch bot for event {event_id}, retrying in {next_delay}s: {e}")
+            # A sync may already have re-added (and rescheduled) the event meanwhile.
+            if event_id not in self.events:
+                self.events[event_id] = fields
+                self._timers[event_id] = asyncio.create_task(self._dispatch_on_time(event_id, next_delay))
+
+    async def _confirm_event(self, event_id: str, fields: dict) -> bool:
+        """
+        Re-lists the moment a meeting starts to check it is still there,
+        unchanged. Incremental `updated_after` listings are bounded by the
+        lookahead window, so they miss meetings moved out of it or deleted
+        outright; this keeps a stale timer from sending the bot.
+        """
+        start_time = fields["start_time"]
+        for event in await self._list_events({"start": start_time - 1, "end": start_time + 1}):
+            if event.get("id") == event_id:
+                return _event_fields(event) == fields
+        return False
+
+    def request_sync(self):
+        """Wakes the sync loop so the next sync runs now instead of at the next poll."""
+        self._sync_requested.set()
+
+    async def run(self):
+        """Keeps the cache in sync until cancelled."""
+        _syncs[self.grant_id] = self
+        try:
+            last_full_sync = 0
+            while True:
+                try:
+                    if (
+                        self._last_sync_at is None
+                        or self._full_sync_requested
+                        or time.time() - last_full_sync >= CALENDAR_FULL_SYNC_SECONDS
+                    ):
+                        self._full_sync_requested = False
+                        await self.full_sync()
+                        last_full_sync = time.time()
+                    else:
+                        await self.incremental_sync()
+                except Exception as e:
+                    print(f"❌ Calendar sync failed for {self.grant_id}: {e}")
+                try:
+                    await asyncio.wait_for(self._sync_requested.wait(), CALENDAR_INCREMENTAL_SYNC_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self._sync_requested.clear()
+        finally:
+            _syncs.pop(self.grant_id, None)
+            for timer in self._timers.values():
+                timer.cancel()
+            self._timers.clear()
+
+
+def apply_calendar_webhook(event_type: str, event: dict) -> bool:
+    """
+    Feeds an event.created / event.updated / event.deleted webhook into the
+    sync engine for its grant.
+
+    Returns:
+        True if this replica runs the grant's sync engine, which applied the
+        change or ignored it (it belongs to another of the grant's calendars).
+    """
+    sync = _syncs.get(event.get("grant_id"))
+    if sync is None:
+        return False
+    # Until the first full sync resolves the calendar's ID the change can't be
+    # matched, but that sync lists the calendar anyway.
+    if event.get("calendar_id") != sync.resolved_calendar_id:
+        return True
+    if event_type == "event.deleted":
+        sync.remove_event(event.get("id"))
+    else:
+        sync.apply_event(event)
+    return True
+
+
+def request_calendar_sync(grant_id: str) -> bool:
+    """
+    Makes the sync engine for a grant sync now, for calendar changes that
+    reached another replica.
+
+    Returns:
+        True if this replica runs the grant's sync engine.
+    """
+    sync = _syncs.get(grant_id)
+    if sync is None:
+        return False
+    sync.request_sync()
+    return True
@@ -1,24 +1,98 @@
 import os
-import motor.motor_asyncio
+import json
+import base64
+import asyncio
 from dotenv import load_dotenv
-from datetime import datetime, timezone # Import timezone
+from datetime import datetime, timedelta, timezone # Import timezone
+from cache import TTLCache
+from metrics import mongo_command_listener
 
 load_dotenv()
 
+# pymongo's index and sort directions. The driver itself (and its errors) is
+# imported only once it is needed, so importing the app doesn't load it.
+ASCENDING = 1
+DESCENDING = -1
+TEXT = "text"
+
 MONGO_DETAILS = os.getenv("MONGO_DETAILS")
-if not MONGO_DETAILS:
-    raise ValueError("Please set your MONGO_DETAILS in the .env file.")
+# Finished jobs are kept this long, then removed by Mongo's TTL monitor. Their
+# IDs only de-duplicate enqueues while they exist, which is long past the
+# point where the same work could be enqueued again.
+JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", "7"))
+
+# Created by init_database() from the app's startup hook rather than at import
+# time, so importing this module needs neither Motor nor a configured database.
+client = None
+database = None
+transcript_collection = None
+scheduled_events_collection = None
+notetakers_collection = None
+jobs_collection = None
+grants_collection = None
+grant_leases_collection = None
+scheduler_replicas_collection = None
+recordings_collection = None
+deletion_sweeps_collection = None
+assets_collection = None
+transcript_indexes_collection = None
+transcript_segments_collection = None
+schedule_requests_collection = None
+
+
+def init_database():
+    """Creates the Motor client and collection handles. Safe to call more than once."""
+    global client, database, transcript_collection, scheduled_events_collection, notetakers_collection
+    global jobs_collection, grants_collection, grant_leases_collection, scheduler_replicas_collection
+    global recordings_collection, deletion_sweeps_collection, assets_collection
+    global transcript_indexes_collection, transcript_segments_collection, schedule_requests_collection
+    if client is not None:
+        return
+    if not MONGO_DETAILS:
+        raise ValueError("Please set your MONGO_DETAILS in the .env file.")
+    import motor.motor_asyncio
+
+    client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_DETAILS, event_listeners=[mongo_command_listener()])
+    database = client.nylas_transcripts
+    transcript_collection = database.get_collection("transcripts")
+    scheduled_events_collection = database.get_collection("scheduled_events")
+    notetakers_collection = database.get_collection("notetakers")
+    jobs_collection = database.get_collection("media_jobs")
+    grants_collection = database.get_collection("grants")
+    grant_leases_collection = database.get_collection("grant_leases")
+    scheduler_replicas_collection = database.get_collection("scheduler_replicas")
+    recordings_collection = database.get_collection("recordings")
+    deletion_sweeps_collection = database.get_collection("deletion_sweeps")
+    assets_collection = database.get_collection("assets")
+    transcript_indexes_collection = database.get_collection("transcript_indexes")
+    transcript_segments_collection = database.get_collection("transcript_segments")
+    schedule_requests_collection = database.get_collection("schedule_requests")
+
 
-client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_DETAILS)
-database = client.nylas_transcripts
-transcript_collection = database.get_collection("transcripts")
-scheduled_events_collection = database.get_collection("scheduled_events")
+async def ensure_indexes():
+    """Creates the indexes the queries below rely on. Safe to call on every startup."""
+    await jobs_collection.create_index([("status", ASCENDING), ("run_at", ASCENDING)])
+    await jobs_collection.create_index([("status", ASCENDING), ("priority", ASCENDING), ("run_at", ASCENDING)])
+    await jobs_collection.create_index([("status", ASCENDING), ("lease_expires_at", ASCENDING)])
+    # Only finished jobs have completed_at, so queued, running and dead jobs are kept.
+    await jobs_collection.create_index("completed_at", expireAfterSeconds=JOB_RETENTION_DAYS * 24 * 3600)
+    # Replicas that stop heart-beating are removed by Mongo's TTL monitor.
+    await scheduler_replicas_collection.create_index("expires_at", expireAfterSeconds=0)
+    # Keyset pagination for /recordings, with and without a status filter.
+    await recordings_collection.create_index([("created_at", DESCENDING), ("_id", DESCENDING)])
+    await recordings_collection.create_index([("status", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)])
+    await assets_collection.create_index([("notetaker_id", ASCENDING), ("_id", ASCENDING)])
+    # Full-text search over transcript segments (a collection can only have one text index).
+    await transcript_segments_collection.create_index([("text", TEXT)])
+    await transcript_segments_collection.create_index([("notetaker_id", ASCENDING), ("start", ASCENDING)])
 
 # --- Transcript and Media Functions ---
 
-async def save_media_result(notetaker_id: str, meet_url: str, transcript_data: dict = None, s3_folder_url: str = None, error: str = None):
+async def save_media_result(notetaker_id: str, meet_url: str, s3_folder_url: str = None, error: str = None):
     """
     Saves the final processed media data, including the S3 folder URL, to MongoDB.
+    The transcript itself is offloaded to S3 (see transcript_store) and only
+    referenced here.
     """
     update_doc = {"meet_url": meet_url}
     if error:
@@ -26,47 +100,721 @@ async def save_media_result(notetaker_id: str, meet_url: str, transcript_data: d
         update_doc["error"] = error
     else:
         update_doc["status"] = "ready"
-        if transcript_data:
-            update_doc["transcript"] = transcript_data
         if s3_folder_url:
             update_doc["s3_folder_url"] = s3_folder_url
             
     await transcript_collection.update_one(
         {"_id": notetaker_id},
-        {"$set": update_doc},
+        {"$set": update_doc, "$inc": {"version": 1}},
         upsert=True
     )
+    _media_status_cache.invalidate(notetaker_id)
+    await set_recording_status(notetaker_id, update_doc["status"])
     print(f"💾 Result for {notetaker_id} saved to MongoDB.")
 
 
-async def get_media_result(notetaker_id: str):
+# Polling clients ask for the same status over and over, so status-only
+# lookups are cached briefly. Writes from this process invalidate the entry;
+# writes from other replicas show up within MEDIA_STATUS_CACHE_TTL seconds.
+MEDIA_STATUS_CACHE_TTL = float(os.getenv("MEDIA_STATUS_CACHE_TTL", "2"))
+_media_status_cache = TTLCache(maxsize=4096, ttl=MEDIA_STATUS_CACHE_TTL)
+_MISSING = object()
+
+async def get_media_result(notetaker_id: str, include_transcript: bool = False):
     """
     Retrieves a result from MongoDB.
+
+    By default the (potentially huge) transcript is left out and the result
+    is served from a short-lived cache; pass `include_transcript=True` to
+    load the full document.
     """
-    return await transcript_collection.find_one({"_id": notetaker_id})
+    if include_transcript:
+        return await transcript_collection.find_one({"_id": notetaker_id})
+
+    result = _media_status_cache.get(notetaker_id, _MISSING)
+    if result is _MISSING:
+        result = await transcript_collection.find_one({"_id": notetaker_id}, {"transcript": 0})
+        _media_status_cache.set(notetaker_id, result)
+    return dict(result) if result else None
 
 async def delete_media_result(notetaker_id: str):
     """
     Deletes a transcription result from MongoDB.
     """
-    delete_result = await transcript_collection.delete_one({"_id": notetaker_id})
-    if delete_result.deleted_count > 0:
+    deleted_count = await delete_media_results([notetaker_id])
+    if deleted_count > 0:
         print(f"💾 Record for {notetaker_id} deleted from MongoDB.")
-    return delete_result
+    return deleted_count
+
+async def delete_media_results(notetaker_ids: list) -> int:
+    """
+    Deletes the results, catalog entries and transcript indexes of many
+    notetakers with one delete_many per collection.
+
+    Returns:
+        The number of media results deleted.
+    """
+    by_id = {"_id": {"$in": notetaker_ids}}
+    by_notetaker = {"notetaker_id": {"$in": notetaker_ids}}
+    delete_result = await transcript_collection.delete_many(by_id)
+    await recordings_collection.delete_many(by_id)
+    await assets_collection.delete_many(by_notetaker)
+    await transcript_indexes_collection.delete_many(by_id)
+    await transcript_segments_collection.delete_many(by_notetaker)
+    for notetaker_id in notetaker_ids:
+        _media_status_cache.invalidate(notetaker_id)
+    return delete_result.deleted_count
+
+async def save_transcript_index(notetaker_id: str, index_doc: dict):
+    """Saves the segment index of a transcript stored in S3."""
+    await transcript_indexes_collection.replace_one({"_id": notetaker_id}, index_doc, upsert=True)
+
+async def get_transcript_index(notetaker_id: str, include_segments: bool = True):
+    """Retrieves a transcript's segment index, optionally without the per-segment entries."""
+    projection = None if include_segments else {"segments": 0}
+    return await transcript_indexes_collection.find_one({"_id": notetaker_id}, projection)
+
+
+# --- Transcript Search Functions ---
+
+SEGMENT_INSERT_BATCH = 1000
+
+async def replace_transcript_segments(notetaker_id: str, segments: list):
+    """
+    Replaces the searchable segments of a notetaker's transcript. Re-running
+    it for the same notetaker is safe.
+    """
+    await transcript_segments_collection.delete_many({"notetaker_id": notetaker_id})
+    documents = [
+        {
+            "notetaker_id": notetaker_id,
+            "start": segment.get("start"),
+            "end": segment.get("end"),
+            "speaker": segment.get("speaker"),
+            "text": segment.get("text") or "",
+        }
+        for segment in segments
+        if segment.get("text")
+    ]
+    for batch_start in range(0, len(documents), SEGMENT_INSERT_BATCH):
+        await transcript_segments_collection.insert_many(documents[batch_start:batch_start + SEGMENT_INSERT_BATCH])
+
+async def search_transcripts(query: str, speaker: str = None, limit: int = 20, segments_per_notetaker: int = 5) -> list:
+    """
+    Full-text searches transcript segments and groups the hits by notetaker.
+
+    Notetakers are ranked by the summed relevance of their matching segments;
+    within each notetaker the best matching segments come first.
+
+    Returns:
+        A list of dicts with the notetaker ID, its score, its match count and
+        its top matching segments (start, end, speaker, text, score).
+    """
+    match = {"$text": {"$search": query}}
+    if speaker:
+        match["speaker"] = speaker
+
+    pipeline = [
+        {"$match": match},
+        {"$addFields": {"score": {"$meta": "textScore"}}},
+        # $topN keeps only the best segments per notetaker while grouping,
+        # instead of collecting every hit and slicing afterwards (MongoDB 5.2+).
+        {"$group": {
+            "_id": "$notetaker_id",
+            "score": {"$sum": "$score"},
+            "match_count": {"$sum": 1},
+            "matches": {"$topN": {
+                "n": segments_per_notetaker,
+                "sortBy": {"score": -1},
+                "output": {
+                    "start": "$start", "end": "$end", "speaker": "$speaker", "text": "$text", "score": "$score"
+                },
+            }},
+        }},
+        {"$sort": {"score": -1}},
+        {"$limit": limit},
+        {"$project": {
+            "_id": 0,
+            "notetaker_id": "$_id",
+            "score": 1,
+            "match_count": 1,
+            "matches": 1,
+        }},
+    ]
+    return await transcript_segments_collection.aggregate(pipeline).to_list(length=limit)
+
+
+# --- Recordings Catalog Functions ---
+# `assets` holds one document per uploaded S3 object; `recordings` holds one
+# summary per notetaker with its status and per-kind asset counts, which is
+# what /recordings pages through.
+
+async def record_asset(object_name: str, notetaker_id: str, kind: str, content_type: str, size: int, created_at: datetime = None):
+    """Adds an uploaded S3 object to the catalog, or updates it if it was re-uploaded."""
+    from pymongo import ReturnDocument
+
+    now = datetime.now(timezone.utc)
+    asset_fields = {"notetaker_id": notetaker_id, "kind": kind, "size": size, "updated_at": now}
+    if content_type:
+        asset_fields["content_type"] = content_type
+    previous = await assets_collection.find_one_and_update(
+        {"_id": object_name},
+        {
+            "$set": asset_fields,
+            "$setOnInsert": {"created_at": created_at or now}
+        },
+        upsert=True,
+        return_document=ReturnDocument.BEFORE
+    )
+
+    summary_update = {
+        "$set": {"updated_at": now},
+        "$setOnInsert": {"created_at": created_at or now, "status": "processing"},
+        "$inc": {"total_bytes": size - (previous["size"] if previous else 0)},
+    }
+    if previous is None:
+        summary_update["$inc"].update({"asset_count": 1, f"asset_counts.{kind}": 1})
+    if kind == "audio":
+        summary_update["$set"]["audio_key"] = object_name
+    await recordings_collection.update_one({"_id": notetaker_id}, summary_update, upsert=True)
+
+async def set_recording_status(notetaker_id: str, status: str):
+    """Updates the status shown for a notetaker in the recordings catalog."""
+    now = datetime.now(timezone.utc)
+    await recordings_collection.update_one(
+        {"_id": notetaker_id},
+        {"$set": {"status": status, "updated_at": now}, "$setOnInsert": {"created_at": now}},
+        upsert=True
+    )
+
+async def settle_backfilled_recordings(notetaker_ids: list):
+    """
+    Gives recordings added to the catalog by a backfill the status of their
+    transcripts document ("ready" or "failed"). Legacy recordings without one
+    finished before the catalog existed, so they are "ready"; those whose
+    result isn't saved yet are still processing and are left alone.
+    """
+    results = {
+        document["_id"]: document.get("status")
+        for document in await transcript_collection.find(
+            {"_id": {"$in": list(notetaker_ids)}}, {"status": 1}
+        ).to_list(length=None)
+    }
+    by_status = {"ready": [], "failed": []}
+    for notetaker_id in notetaker_ids:
+        status = results[notetaker_id] if notetaker_id in results else "ready"
+        if status in by_status:
+            by_status[status].append(notetaker_id)
+    for status, ids in by_status.items():
+        if ids:
+            await recordings_collection.update_many(
+                {"_id": {"$in": ids}, "status": "processing"},
+                {"$set": {"status": status}}
+            )
+
+def _encode_cursor(recording: dict) -> str:
+    position = {"created_at": recording["created_at"].isoformat(), "id": recording["_id"]}
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+def _decode_cursor(cursor: str):
+    position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return datetime.fromisoformat(position["created_at"]), position["id"]
+
+async def list_recordings(limit: int = 50, cursor: str = None, status: str = None,
+                          created_after: datetime = None, created_before: datetime = None):
+    """
+    Pages through the recordings catalog, newest first.
+
+    Pagination is keyset-based on (created_at, _id), so every page is an index
+    range scan no matter how deep into the catalog it is.
+
+    Args:
+        limit: Maximum number of recordings to return.
+        cursor: The `next_cursor` from the previous page.
+        status: Only return recordings with this status.
+        created_after, created_before: Only return recordings created in this range.
+
+    Returns:
+        A tuple of the recordings on this page and the cursor for the next page
+        (None on the last page).
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    query = {}
+    if status:
+        query["status"] = status
+    if created_after or created_before:
+        query["created_at"] = {}
+        if created_after:
+            query["created_at"]["$gte"] = created_after
+        if created_before:
+            query["created_at"]["$lt"] = created_before
+    if cursor:
+        try:
+            cursor_created_at, cursor_id = _decode_cursor(cursor)
+        except Exception:
+            raise ValueError("Invalid cursor.")
+        query["$or"] = [
+            {"created_at": {"$lt": cursor_created_at}},
+            {"created_at": cursor_created_at, "_id": {"$lt": cursor_id}},
+        ]
+
+    recordings = await recordings_collection.find(query).sort(
+        [("created_at", DESCENDING), ("_id", DESCENDING)]
+    ).limit(limit + 1).to_list(length=limit + 1)
+
+    next_cursor = _encode_cursor(recordings[limit - 1]) if len(recordings) > limit else None
+    return recordings[:limit], next_cursor
+
+async def list_assets(notetaker_id: str) -> list:
+    """Returns every cataloged S3 object of a notetaker."""
+    return await assets_collection.find({"notetaker_id": notetaker_id}).sort("_id", ASCENDING).to_list(length=None)
+
+async def get_asset(object_name: str):
+    """Returns the catalog entry of an S3 object, or None if it isn't cataloged."""
+    return await assets_collection.find_one({"_id": object_name})
+
+async def find_recordings_created_before(cutoff: datetime, limit: int) -> list:
+    """Returns the IDs of up to `limit` cataloged recordings created before `cutoff`, oldest first."""
+    recordings = await recordings_collection.find(
+        {"created_at": {"$lt": cutoff}}, {"_id": 1}
+    ).sort("created_at", ASCENDING).limit(limit).to_list(length=limit)
+    return [recording["_id"] for recording in recordings]
+
+
+# --- Deletion Sweep Functions ---
+
+async def create_deletion_sweep(sweep_id: str, kind: str, params: dict):
+    """Records a new bulk or retention deletion sweep so its progress can be followed."""
+    await deletion_sweeps_collection.insert_one({
+        "_id": sweep_id,
+        "kind": kind,
+        "params": params,
+        "status": "queued",
+        "deleted_recordings": 0,
+        "deleted_objects": 0,
+        "created_at": datetime.now(timezone.utc)
+    })
+
+async def update_deletion_sweep(sweep_id: str, status: str = None, deleted_recordings: int = 0, deleted_objects: int = 0, error: str = None):
+    """Adds to a sweep's progress counters and optionally changes its status."""
+    update = {
+        "$inc": {"deleted_recordings": deleted_recordings, "deleted_objects": deleted_objects},
+        "$set": {"updated_at": datetime.now(timezone.utc)}
+    }
+    if status:
+        update["$set"]["status"] = status
+    if error:
+        update["$set"]["error"] = error
+    await deletion_sweeps_collection.update_one({"_id": sweep_id}, update)
+
+async def get_deletion_sweep(sweep_id: str):
+    """Retrieves a deletion sweep and its progress."""
+    return await deletion_sweeps_collection.find_one({"_id": sweep_id})
 
 
 # --- Scheduled Event Tracking Functions ---
 
-async def is_bot_invited(event_id: str) -> bool:
-    """Checks if a bot has already been invited for a given event ID."""
-    document = await scheduled_events_collection.find_one({"_id": event_id})
-    return document is not None
+async def claim_bot_dispatch(event_id: str):
+    """
+    Claims an event before its bot is invited, so that no other attempt (a
+    retry, or another replica after a lease move) can invite a second bot.
+
+    Returns:
+        None if the caller now owns the event and should invite the bot,
+        otherwise the existing record: "pending" while an invite is in
+        flight or its outcome is unknown, "invited" with the notetaker ID.
+    """
+    from pymongo.errors import DuplicateKeyError
+
+    try:
+        await scheduled_events_collection.insert_one(
+            {"_id": event_id, "status": "pending", "claimed_at": datetime.now(timezone.utc)}
+        )
+        return None
+    except DuplicateKeyError:
+        return await scheduled_events_collection.find_one({"_id": event_id})
+
+async def release_bot_dispatch(event_id: str):
+    """Gives up a pending claim whose invite is known not to have reached Nylas."""
+    await scheduled_events_collection.delete_one({"_id": event_id, "status": "pending"})
 
 async def mark_bot_invited(event_id: str, notetaker_id: str):
-    """Marks that a bot has been invited for an event to prevent duplicate invites."""
-    await scheduled_events_collection.insert_one({
-        "_id": event_id,
-        "notetaker_id": notetaker_id,
-        # FIX: Replaced datetime.utcnow() with the modern equivalent
-        "invited_at": datetime.now(timezone.utc)
-    })
\ No newline at end of file
+    """Records the notetaker invited for a claimed event."""
+    await scheduled_events_collection.update_one(
+        {"_id": event_id},
+        {"$set": {
+            "status": "invited",
+            "notetaker_id": notetaker_id,
+            # FIX: Replaced datetime.utcnow() with the modern equivalent
+            "invited_at": datetime.now(timezone.utc)
+        }},
+        upsert=True
+    )
+
+
+# --- Schedule Request Functions ---
+# Idempotency records for /schedule-bot/batch, keyed by grant and the
+# client's idempotency key. A record is "pending" while its event is being
+# created, then "created" with the event ID, or "failed" so it can be retried.
+
+SCHEDULE_REQUEST_STALE_SECONDS = 600
+
+async def claim_schedule_request(key: str, request: dict):
+    """
+    Claims an idempotency key for creating an event.
+
+    A failed attempt, or a pending one abandoned for longer than
+    SCHEDULE_REQUEST_STALE_SECONDS (its process died), can be claimed again.
+
+    Returns:
+        None if the caller now owns the key and should create the event,
+        otherwise the existing record.
+    """
+    from pymongo.errors import DuplicateKeyError
+
+    now = datetime.now(timezone.utc)
+    try:
+        await schedule_requests_collection.insert_one(
+            {"_id": key, "status": "pending", "request": request, "created_at": now, "claimed_at": now}
+        )
+        return None
+    except DuplicateKeyError:
+        pass
+
+    reclaimed = await schedule_requests_collection.find_one_and_update(
+        {"_id": key, "$or": [
+            {"status": "failed"},
+            {"status": "pending", "claimed_at": {"$lt": now - timedelta(seconds=SCHEDULE_REQUEST_STALE_SECONDS)}}
+        ]},
+        {"$set": {"status": "pending", "request": request, "claimed_at": now}, "$unset": {"error": ""}}
+    )
+    if reclaimed is not None:
+        return None
+    return await schedule_requests_collection.find_one({"_id": key})
+
+async def complete_schedule_request(key: str, event_id: str = None, error: str = None):
+    """Records the outcome of a claimed schedule request."""
+    update = {"completed_at": datetime.now(timezone.utc)}
+    if error:
+        update.update({"status": "failed", "error": error})
+    else:
+        update.update({"status": "created", "event_id": event_id})
+    await schedule_requests_collection.update_one({"_id": key}, {"$set": update})
+
+
+# --- Grant Functions ---
+
+async def add_grant(grant_id: str, calendar_id: str = "primary"):
+    """Adds (or re-activates) a grant whose calendar the scheduler should watch."""
+    await grants_collection.update_one(
+        {"_id": grant_id},
+        {
+            "$set": {"calendar_id": calendar_id, "active": True},
+            "$setOnInsert": {"created_at": datetime.now(timezone.utc)}
+        },
+        upsert=True
+    )
+
+async def deactivate_grant(grant_id: str):
+    """Stops the scheduler from watching a grant's calendar."""
+    return await grants_collection.update_one({"_id": grant_id}, {"$set": {"active": False}})
+
+async def list_active_grants() -> list:
+    """Returns every grant the scheduler should watch."""
+    return await grants_collection.find({"active": True}).to_list(length=None)
+
+async def flag_calendar_sync(grant_id: str):
+    """
+    Asks whichever scheduler replica owns an active grant to sync its calendar
+    now, for calendar webhooks that reach a replica that doesn't own it.
+    """
+    await grants_collection.update_one(
+        {"_id": grant_id, "active": True},
+        {"$set": {"sync_requested_at": datetime.now(timezone.utc)}}
+    )
+
+async def take_calendar_sync_flags(grant_ids: list) -> list:
+    """
+    Clears the sync requests flagged on any of `grant_ids` and returns the
+    grants that had one. A request flagged again in the meantime is kept.
+    """
+    flagged = await grants_collection.find(
+        {"_id": {"$in": list(grant_ids)}, "sync_requested_at": {"$ne": None}},
+        {"sync_requested_at": 1}
+    ).to_list(length=None)
+    taken = []
+    for grant in flagged:
+        result = await grants_collection.update_one(
+            {"_id": grant["_id"], "sync_requested_at": grant["sync_requested_at"]},
+            {"$unset": {"sync_requested_at": ""}}
+        )
+        if result.modified_count:
+            taken.append(grant["_id"])
+    return taken
+
+
+# --- Scheduler Sharding Functions ---
+# Each scheduler replica heartbeats a document in `scheduler_replicas` and
+# owns the grants it holds a time-limited lease for in `grant_leases`.
+
+async def heartbeat_replica(replica_id: str, ttl_seconds: int):
+    """Records that a scheduler replica is alive for the next `ttl_seconds`."""
+    await scheduler_replicas_collection.update_one(
+        {"_id": replica_id},
+        {"$set": {"expires_at": datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)}},
+        upsert=True
+    )
+
+async def count_live_replicas() -> int:
+    """Returns the number of scheduler replicas with an unexpired heartbeat."""
+    return await scheduler_replicas_collection.count_documents(
+        {"expires_at": {"$gt": datetime.now(timezone.utc)}}
+    )
+
+async def remove_replica(replica_id: str):
+    """Removes a scheduler replica that is shutting down."""
+    await scheduler_replicas_collection.delete_one({"_id": replica_id})
+
+async def acquire_grant_lease(grant_id: str, owner: str, lease_seconds: int) -> bool:
+    """
+    Takes or renews the lease on a grant. Succeeds if the lease is free,
+    expired, or already held by `owner`.
+    """
+    from pymongo.errors import DuplicateKeyError
+
+    now = datetime.now(timezone.utc)
+    try:
+        await grant_leases_collection.update_one(
+            {"_id": grant_id, "$or": [{"owner": owner}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=lease_seconds)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        # The lease exists and is held by another live replica.
+        return False
+
+async def release_grant_lease(grant_id: str, owner: str):
+    """Gives up a grant's lease so another replica can take it straight away."""
+    await grant_leases_collection.delete_one({"_id": grant_id, "owner": owner})
+
+
+# --- Notetaker State Functions ---
+
+async def register_notetaker(notetaker_id: str, grant_id: str, meet_url: str, video_requested: bool):
+    """Records a newly invited notetaker so webhook events can be matched to it."""
+    await notetakers_collection.update_one(
+        {"_id": notetaker_id},
+        {"$setOnInsert": {
+            "grant_id": grant_id,
+            "meet_url": meet_url,
+            "video_requested": video_requested,
+            "state": "scheduled",
+            "state_rank": 0,
+            "created_at": datetime.now(timezone.utc)
+        }},
+        upsert=True
+    )
+
+async def get_notetaker(notetaker_id: str):
+    """Retrieves a tracked notetaker."""
+    return await notetakers_collection.find_one({"_id": notetaker_id})
+
+async def save_transcript(notetaker_id: str, meet_url: str, transcript_ref: dict):
+    """
+    Records where a notetaker's offloaded transcript is stored, ahead of the
+    final result, once its pipeline stage finishes.
+    """
+    await transcript_collection.update_one(
+        {"_id": notetaker_id},
+        {"$set": {"meet_url": meet_url, "transcript_ref": transcript_ref}, "$inc": {"version": 1}},
+        upsert=True
+    )
+    _media_status_cache.invalidate(notetaker_id)
+
+async def save_checkpoint(notetaker_id: str, stage: str, data: dict = None):
+    """Records that a media pipeline stage has finished for a notetaker."""
+    checkpoint = {"completed_at": datetime.now(timezone.utc), **(data or {})}
+    await notetakers_collection.update_one(
+        {"_id": notetaker_id},
+        {"$set": {f"checkpoints.{stage}": checkpoint}}
+    )
+
+async def record_upload(notetaker_id: str, object_name: str, sha256: str):
+    """Records an uploaded S3 object and its content hash against its notetaker."""
+    await notetakers_collection.update_one(
+        {"_id": notetaker_id},
+        {"$addToSet": {"uploads": {"key": object_name, "sha256": sha256}}}
+    )
+
+async def advance_notetaker_state(notetaker_id: str, state: str, state_rank: int):
+    """
+    Moves a notetaker to a new state, but only if it is further along than the
+    current one. Webhooks can be retried or arrive out of order, so stale and
+    duplicate transitions are ignored atomically.
+
+    Returns:
+        The updated notetaker document, or None if the transition was ignored.
+    """
+    from pymongo import ReturnDocument
+
+    return await notetakers_collection.find_one_and_update(
+        {"_id": notetaker_id, "state_rank": {"$lt": state_rank}},
+        {"$set": {
+            "state": state,
+            "state_rank": state_rank,
+            "state_updated_at": datetime.now(timezone.utc)
+        }},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+
+# --- Durable Job Queue Functions ---
+# Jobs move queued -> running -> done. A running job is leased to one worker
+# until `lease_expires_at`; if the worker dies and stops heart-beating, any
+# other worker may claim it again. Failed jobs go back to queued with a later
+# `run_at`, or to dead once they run out of attempts.
+
+async def enqueue_job(job_id: str, kind: str, payload: dict, delay_seconds: int = 0, priority: int = 0) -> bool:
+    """
+    Adds a job to the queue. Enqueueing an existing job ID is a no-op, so
+    callers can safely enqueue the same work more than once. Due jobs are
+    claimed lowest `priority` first, then oldest first.
+
+    Returns:
+        True if a new job was created.
+    """
+    now = datetime.now(timezone.utc)
+    result = await jobs_collection.update_one(
+        {"_id": job_id},
+        {"$setOnInsert": {
+            "kind": kind,
+            "payload": payload,
+            "status": "queued",
+            "priority": priority,
+            "attempts": 0,
+            "run_at": now + timedelta(seconds=delay_seconds),
+            "created_at": now
+        }},
+        upsert=True
+    )
+    return result.upserted_id is not None
+
+async def claim_job(worker_id: str, lease_seconds: int, exclude_kinds=()):
+    """
+    Atomically leases the next due job to a worker. Jobs whose lease has
+    expired (their worker crashed) are claimed again.
+
+    Args:
+        exclude_kinds: Job kinds the worker can't take on right now.
+
+    Returns:
+        The claimed job document, or None if nothing is due.
+    """
+    from pymongo import ReturnDocument
+
+    now = datetime.now(timezone.utc)
+    query = {"$or": [
+        {"status": "queued", "run_at": {"$lte": now}},
+        {"status": "running", "lease_expires_at": {"$lt": now}}
+    ]}
+    if exclude_kinds:
+        query["kind"] = {"$nin": list(exclude_kinds)}
+    return await jobs_collection.find_one_and_update(
+        query,
+        {
+            "$set": {
+                "status": "running",
+                "lease_owner": worker_id,
+                "lease_expires_at": now + timedelta(seconds=lease_seconds)
+            },
+            "$inc": {"attempts": 1}
+        },
+        sort=[("priority", ASCENDING), ("run_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER
+    )
+
+async def heartbeat_job(job_id: str, worker_id: str, lease_seconds: int) -> bool:
+    """
+    Extends a job's lease.
+
+    Returns:
+        False if the worker no longer owns the job.
+    """
+    result = await jobs_collection.update_one(
+        {"_id": job_id, "status": "running", "lease_owner": worker_id},
+        {"$set": {"lease_expires_at": datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)}}
+    )
+    return result.matched_count > 0
+
+async def complete_job(job_id: str, worker_id: str):
+    """Marks a leased job as done."""
+    await jobs_collection.update_one(
+        {"_id": job_id, "lease_owner": worker_id},
+        {
+            "$set": {"status": "done", "completed_at": datetime.now(timezone.utc)},
+            "$unset": {"lease_owner": "", "lease_expires_at": ""}
+        }
+    )
+
+async def reschedule_job(job_id: str, worker_id: str, delay_seconds: int, error: str = None, count_attempt: bool = True):
+    """
+    Puts a leased job back in the queue to run again after `delay_seconds`.
+    With `count_attempt=False` the run doesn't count towards the job's attempts.
+    """
+    update = {
+        "$set": {
+            "status": "queued",
+            "run_at": datetime.now(timezone.utc) + timedelta(seconds=delay_seconds),
+            "last_error": error
+        },
+        "$unset": {"lease_owner": "", "lease_expires_at": ""}
+    }
+    if not count_attempt:
+        update["$inc"] = {"attempts": -1}
+    await jobs_collection.update_one({"_id": job_id, "lease_owner": worker_id}, update)
+
+async def dead_letter_job(job_id: str, worker_id: str, error: str):
+    """Moves a leased job that has run out of attempts to the dead-letter state."""
+    await jobs_collection.update_one(
+        {"_id": job_id, "lease_owner": worker_id},
+        {
+            "$set": {"status": "dead", "last_error": error, "dead_at": datetime.now(timezone.utc)},
+            "$unset": {"lease_owner": "", "lease_expires_at": ""}
+        }
+    )
+
+async def revive_job(job_id: str) -> bool:
+    """
+    Puts a dead-lettered or finished job back in the queue with fresh
+    attempts, for recurring jobs that must always be scheduled.
+
+    Returns:
+        True if the job was revived.
+    """
+    result = await jobs_collection.update_one(
+        {"_id": job_id, "status": {"$in": ["dead", "done"]}},
+        {
+            "$set": {"status": "queued", "attempts": 0, "run_at": datetime.now(timezone.utc)},
+            "$unset": {"dead_at": "", "completed_at": ""}
+        }
+    )
+    return result.modified_count > 0
+
+async def count_jobs_by_status() -> dict:
+    """
+    Counts the jobs that haven't finished: queued jobs that are due, queued
+    jobs scheduled for later, running jobs and dead-lettered jobs. Each count
+    is served by the (status, ...) indexes.
+    """
+    now = datetime.now(timezone.utc)
+    queued_due, queued_scheduled, running, dead = await asyncio.gather(
+        jobs_collection.count_documents({"status": "queued", "run_at": {"$lte": now}}),
+        jobs_collection.count_documents({"status": "queued", "run_at": {"$gt": now}}),
+        jobs_collection.count_documents({"status": "running"}),
+        jobs_collection.count_documents({"status": "dead"}),
+    )
+    return {"queued_due": queued_due, "queued_scheduled": queued_scheduled, "running": running, "dead": dead}
@@ -0,0 +1,183 @@
+import os
+import random
+import socket
+import asyncio
+from uuid import uuid4
+from metrics import observe_stage, track_in_flight
+from database import (
+    enqueue_job, claim_job, heartbeat_job, complete_job, reschedule_job, dead_letter_job
+)
+
+# --- Configuration ---
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "4"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_HEARTBEAT_SECONDS = max(JOB_LEASE_SECONDS // 4, 1)
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_BASE_SECONDS = int(os.getenv("JOB_RETRY_BASE_SECONDS", "30"))
+JOB_RETRY_MAX_SECONDS = 3600
+# How long an idle worker waits before checking Mongo for due jobs again.
+JOB_POLL_SECONDS = int(os.getenv("JOB_POLL_SECONDS", "5"))
+
+# Identifies this process as the owner of the jobs it leases.
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+
+
+class RetryLater(Exception):
+    """
+    Raised by a job handler to run the job again later without counting it as
+    a failed attempt, e.g. when polling for something that isn't ready yet.
+    """
+
+    def __init__(self, delay_seconds: int):
+        super().__init__(f"retry in {delay_seconds}s")
+        self.delay_seconds = delay_seconds
+
+
+_handlers = {}
+_dead_letter_handlers = {}
+_ready_checks = {}
+# Set when a job is enqueued from this process, so an idle worker picks it up
+# right away instead of waiting for its next poll.
+_wakeup = asyncio.Event()
+
+
+def job_handler(kind: str, on_dead_letter=None, ready=None):
+    """
+    Registers an async function as the handler for a job kind.
+
+    Args:
+        kind: The job kind the handler processes.
+        on_dead_letter: Optional async function called with the job's payload
+            and last error once the job has run out of attempts.
+        ready: Optional function returning False while this worker shouldn't
+            claim more jobs of this kind; they stay queued for other workers.
+    """
+    def register(func):
+        _handlers[kind] = func
+        if on_dead_letter:
+            _dead_letter_handlers[kind] = on_dead_letter
+        if ready:
+            _ready_checks[kind] = ready
+        return func
+    return register
+
+
+async def enqueue(job_id: str, kind: str, payload: dict, delay_seconds: int = 0, priority: int = 0) -> bool:
+    """
+    Durably enqueues a job. Job IDs are idempotency keys: enqueueing the same
+    ID twice creates a single job. Lower `priority` values are claimed first.
+
+    Returns:
+        True if a new job was created.
+    """
+    created = await enqueue_job(job_id, kind, payload, delay_seconds, priority)
+    if created and delay_seconds <= 0:
+        _wakeup.set()
+    return created
+
+
+def _retry_delay(attempts: int) -> float:
+    """Exponential backoff with jitter, so failing jobs don't retry in lockstep."""
+    delay = min(JOB_RETRY_BASE_SECONDS * (2 ** (attempts - 1)), JOB_RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.5, 1.0)
+
+
+async def _keep_lease(job_id: str, handler_task: asyncio.Task):
+    """
+    Heartbeats a job's lease, cancelling the handler only once the lease is
+    known to be lost. A failed heartbeat (e.g. during a replica-set stepdown)
+    is retried on the next beat; the lease has room for several misses.
+    """
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+        try:
+            renewed = await heartbeat_job(job_id, WORKER_ID, JOB_LEASE_SECONDS)
+        except Exception as e:
+            print(f"⚠️ Heartbeat for job {job_id} failed, retrying: {e}")
+            continue
+        if not renewed:
+            print(f"⚠️ Lost the lease on job {job_id}; another worker has taken it over.")
+            handler_task.cancel()
+            return
+
+
+async def _dead_letter(job: dict, error: str):
+    print(f"💀 Job {job['_id']} failed {job['attempts']} times and was dead-lettered: {error}")
+    await dead_letter_job(job["_id"], WORKER_ID, error)
+    on_dead_letter = _dead_letter_handlers.get(job["kind"])
+    if on_dead_letter:
+        await on_dead_letter(job["payload"], error)
+
+
+async def _run_job(job: dict):
+    job_id, kind = job["_id"], job["kind"]
+    handler = _handlers.get(kind)
+    if handler is None:
+        await dead_letter_job(job_id, WORKER_ID, f"No handler registered for job kind '{kind}'.")
+        return
+    if job["attempts"] > JOB_MAX_ATTEMPTS:
+        # Only reachable when earlier attempts never reported back: their
+        # worker crashed (e.g. was OOM-killed) and the lease expired. Running
+        # the job again would likely take this worker down too.
+        error = job.get("last_error") or "Worker died while running the job (lease expired)."
+        await _dead_letter(job, error)
+        return
+
+    handler_task = asyncio.create_task(handler(job["payload"]))
+    lease_task = asyncio.create_task(_keep_lease(job_id, handler_task))
+    try:
+        with observe_stage(f"job_{kind}"), track_in_flight(kind):
+            await handler_task
+        await complete_job(job_id, WORKER_ID)
+    except RetryLater as e:
+        await reschedule_job(job_id, WORKER_ID, e.delay_seconds, count_attempt=False)
+    except asyncio.CancelledError:
+        if not handler_task.cancelled() or asyncio.current_task().cancelling():
+            raise
+        # The lease was lost; the new owner is responsible for the job now.
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        if job["attempts"] >= JOB_MAX_ATTEMPTS:
+            await _dead_letter(job, error)
+        else:
+            delay = _retry_delay(job["attempts"])
+            print(f"🔁 Job {job_id} failed (attempt {job['attempts']}/{JOB_MAX_ATTEMPTS}), retrying in {delay:.0f}s: {error}")
+            await reschedule_job(job_id, WORKER_ID, delay, error=error)
+    finally:
+        lease_task.cancel()
+
+
+async def _worker_loop():
+    while True:
+        try:
+            # Backpressure: leave kinds this worker can't take on right now in the queue.
+            busy_kinds = [kind for kind, ready in _ready_checks.items() if not ready()]
+            job = await claim_job(WORKER_ID, JOB_LEASE_SECONDS, exclude_kinds=busy_kinds)
+        except Exception as e:
+            print(f"❌ Error claiming job: {e}")
+            job = None
+
+        if job is None:
+            _wakeup.clear()
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        try:
+            await _run_job(job)
+        except Exception as e:
+            # e.g. Mongo unavailable while recording the outcome; the lease
+            # expires and the job is retried, but this worker slot must live on.
+            print(f"❌ Error finishing job {job['_id']}: {e}")
+
+
+async def run_job_worker():
+    """
+    Processes jobs from the durable queue until cancelled. Any number of
+    processes may run this against the same database; each job is leased to
+    one worker at a time.
+    """
+    print(f"✅ Job worker {WORKER_ID} started with {JOB_WORKER_CONCURRENCY} slots.")
+    await asyncio.gather(*(_worker_loop() for _ in range(JOB_WORKER_CONCURRENCY)))
@@ -1,38 +1,71 @@
+import os
 import asyncio
-from fastapi import FastAPI, BackgroundTasks, HTTPException
+import json
+from fastapi import FastAPI, BackgroundTasks, Header, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse
 from pydantic import BaseModel
-from nylas.models.errors import NylasApiError
-from nylas.models.notetakers import InviteNotetakerRequest
-from nylas_client import client, NYLAS_GRANT_ID
-from tasks import check_and_get_media
-from database import get_media_result
-from s3_uploader import s3_client, AWS_S3_BUCKET_NAME
-from botocore.exceptions import ClientError
+from nylas_client import NYLAS_GRANT_ID
+from nylas_api import create_event, nylas_error_detail
+from database import get_media_result, list_recordings, list_assets, get_asset, search_transcripts, get_deletion_sweep
+from s3_uploader import AWS_S3_BUCKET_NAME, backfill_catalog_from_s3, get_presigned_url
 from s3_uploader import delete_folder_from_s3
 from database import delete_media_result
 from scheduler_service import run_scheduler_check
-from nylas.models.events import CreateAutocreate, When, Conferencing, Details
-from nylas.models.events import CreateEventRequest
+from media_worker import shutdown_media_worker
+from job_queue import run_job_worker
+from database import init_database, ensure_indexes, add_grant, deactivate_grant
+from database import claim_schedule_request, complete_schedule_request
+from retention import (
+    start_bulk_deletion, start_retention_sweep, schedule_retention, MAX_BULK_DELETE_IDS
+)
+from transcript_store import load_transcript, read_transcript_segments
+from webhooks import NYLAS_WEBHOOK_SECRET, verify_webhook_signature, handle_webhook_event
+from metrics import monitor_event_loop_lag, render_metrics
+from prometheus_client import CONTENT_TYPE_LATEST
 from datetime import datetime
+from typing import TYPE_CHECKING, List, Optional
 from contextlib import asynccontextmanager
+from functools import lru_cache
 import pytz # For handling timezones
 
+if TYPE_CHECKING:
+    from nylas.models.events import CreateEventRequest
+
 
 class TranscriptionRequest(BaseModel):
     meet_url: str
 
 
 
+# Set to "false" on API-only replicas and run `python worker.py` elsewhere instead.
+RUN_JOB_WORKER = os.getenv("RUN_JOB_WORKER", "true").lower() == "true"
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     Handles application startup and shutdown events.
+
+    Clients are created here rather than when modules are imported: Mongo is
+    connected now, while the S3 and Nylas clients (and their SDKs) are built
+    on first use.
     """
+    init_database()
+    await ensure_indexes()
+    await schedule_retention()
     print("Application startup: Starting scheduler service in the background.")
-    task = asyncio.create_task(run_scheduler_check())
+    background_tasks = [
+        asyncio.create_task(run_scheduler_check()),
+        asyncio.create_task(monitor_event_loop_lag()),
+    ]
+    if RUN_JOB_WORKER:
+        background_tasks.append(asyncio.create_task(run_job_worker()))
     yield
     print("Application shutdown: Stopping scheduler service.")
-    task.cancel()
+    for task in background_tasks:
+        task.cancel()
+    shutdown_media_worker()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -42,6 +75,21 @@ class ScheduleBotRequest(BaseModel):
     start_date: str # Format: "YYYY-MM-DD"
     start_time: str # Format: "HH:MM" (24-hour)
     timezone: str = "Asia/Kolkata"
+    grant_id: Optional[str] = None # Defaults to NYLAS_GRANT_ID
+
+class ScheduleBotBatchItem(ScheduleBotRequest):
+    # Retrying a batch never creates a second event for the same key and grant.
+    idempotency_key: Optional[str] = None
+
+class ScheduleBotBatchRequest(BaseModel):
+    meetings: List[ScheduleBotBatchItem]
+
+class BulkDeleteRequest(BaseModel):
+    notetaker_ids: List[str]
+
+class GrantRequest(BaseModel):
+    grant_id: str
+    calendar_id: str = "primary"
 
 def get_provider_from_url(url: str) -> str:
     if "zoom.us" in url:
@@ -53,130 +101,400 @@ def get_provider_from_url(url: str) -> str:
     else:
         return "unknown"
 
-@app.post("/schedule-bot")
-async def schedule_bot_for_meeting(request: ScheduleBotRequest):
+# Upper bound on meetings in one /schedule-bot/batch request.
+MAX_SCHEDULE_BATCH_SIZE = int(os.getenv("MAX_SCHEDULE_BATCH_SIZE", "500"))
+
+
+@lru_cache(maxsize=None)
+def _timezone(name: str):
+    return pytz.timezone(name)
+
+def _build_event_request(request: ScheduleBotRequest) -> tuple:
     """
-    Creates a calendar event to schedule the bot to join a specific meeting at a specific time.
-    The bot will stay until the meeting ends.
+    Validates a scheduling request and builds the calendar event for it.
+
+    Returns:
+        A (grant_id, event_request, start_datetime_local) tuple.
+
+    Raises:
+        ValueError: If the request can't be scheduled as given.
     """
-    if not client:
-        raise HTTPException(status_code=500, detail="Nylas client not initialized.")
+    grant_id = request.grant_id or NYLAS_GRANT_ID
+    if not grant_id:
+        raise ValueError("No grant_id given and NYLAS_GRANT_ID is not set.")
 
+    # 1. Convert user-provided date and time into Unix timestamps
+    try:
+        local_tz = _timezone(request.timezone)
+    except pytz.UnknownTimeZoneError:
+        raise ValueError(f"Unknown timezone: {request.timezone}")
     try:
-        # 1. Convert user-provided date and time into Unix timestamps
-        local_tz = pytz.timezone(request.timezone)
         start_datetime_local = local_tz.localize(datetime.strptime(f"{request.start_date} {request.start_time}", "%Y-%m-%d %H:%M"))
-        start_timestamp = int(start_datetime_local.timestamp())
-        
-        # NEW: Set a default 1-hour duration for the calendar event placeholder
-        end_timestamp = start_timestamp + 3600 # 3600 seconds = 1 hour
-
-        # 2. Get the provider dynamically from the URL
-        provider = get_provider_from_url(request.meet_url)
-
-        # 3. Prepare the request to create a calendar event
-        event_request: CreateEventRequest = {
-            "calendar_id": "primary",
-            "title": f"Automated Recording: {request.meet_url}",
-            "when": {
-                "start_time": start_timestamp,
-                "end_time": end_timestamp, # Use the default end time
-            },
-            "conferencing": {
-                "provider": provider,
-                "details": {
-                    "url": request.meet_url
-                }
+    except ValueError:
+        raise ValueError("start_date and start_time must be formatted as YYYY-MM-DD and HH:MM.")
+    start_timestamp = int(start_datetime_local.timestamp())
+
+    # NEW: Set a default 1-hour duration for the calendar event placeholder
+    end_timestamp = start_timestamp + 3600 # 3600 seconds = 1 hour
+
+    # 2. Get the provider dynamically from the URL
+    provider = get_provider_from_url(request.meet_url)
+
+    # 3. Prepare the request to create a calendar event
+    event_request: CreateEventRequest = {
+        "calendar_id": "primary",
+        "title": f"Automated Recording: {request.meet_url}",
+        "when": {
+            "start_time": start_timestamp,
+            "end_time": end_timestamp, # Use the default end time
+        },
+        "conferencing": {
+            "provider": provider,
+            "details": {
+                "url": request.meet_url
             }
         }
+    }
+    return grant_id, event_request, start_datetime_local
+
+async def _create_calendar_event(grant_id: str, event_request: dict) -> str:
+    """Creates the event using the Nylas Calendar API and returns its ID."""
+    created_event_response = await create_event(
+        grant_id,
+        request_body=event_request,
+        query_params={"calendar_id": "primary"}
+    )
+    event_id = created_event_response.data.id
+    print(f"✅ Calendar event created with ID: {event_id} for a {event_request['conferencing']['provider']} meeting.")
+    return event_id
 
-        # 4. Create the event using the Nylas Calendar API
-        created_event_response = client.events.create(
-            identifier=NYLAS_GRANT_ID,
-            request_body=event_request,
-            query_params={"calendar_id": "primary"}
-        )
-        
-        event_id = created_event_response.data.id
-        print(f"✅ Calendar event created with ID: {event_id} for a {provider} meeting.")
+@app.post("/schedule-bot")
+async def schedule_bot_for_meeting(request: ScheduleBotRequest):
+    """
+    Creates a calendar event to schedule the bot to join a specific meeting at a specific time.
+    The bot will stay until the meeting ends.
+    """
+    try:
+        grant_id, event_request, start_datetime_local = _build_event_request(request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
+    try:
+        event_id = await _create_calendar_event(grant_id, event_request)
         return {
             "message": "Bot has been scheduled to join the meeting. It will stay until the meeting ends.",
             "event_id": event_id,
             "scheduled_for": start_datetime_local.isoformat()
         }
 
-    except NylasApiError as e:
-        raise HTTPException(status_code=400, detail=str(e.provider_error or e))
     except Exception as e:
+        detail = nylas_error_detail(e)
+        if detail is not None:
+            raise HTTPException(status_code=400, detail=detail)
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _schedule_batch_item(index: int, item: ScheduleBotBatchItem, grant_id: str, event_request: dict, start_datetime_local) -> dict:
+    result = {
+        "index": index,
+        "idempotency_key": item.idempotency_key,
+        "scheduled_for": start_datetime_local.isoformat(),
+    }
+    key = f"{grant_id}:{item.idempotency_key}" if item.idempotency_key else None
+    if key:
+        existing = await claim_schedule_request(key, jsonable_encoder(item))
+        if existing is not None:
+            if existing["status"] == "created":
+                return {**result, "status": "existing", "event_id": existing["event_id"]}
+            return {**result, "status": "in_progress"}
+
+    try:
+        event_id = await _create_calendar_event(grant_id, event_request)
+    except Exception as e:
+        error = nylas_error_detail(e) or str(e)
+        if key:
+            await complete_schedule_request(key, error=error)
+        return {**result, "status": "failed", "error": error}
+
+    if key:
+        await complete_schedule_request(key, event_id=event_id)
+    return {**result, "status": "created", "event_id": event_id}
+
+@app.post("/schedule-bot/batch")
+async def schedule_bots_batch(request: ScheduleBotBatchRequest):
+    """
+    Schedules the bot for many meetings at once.
+
+    Every meeting is validated before any event is created; if one is invalid
+    the whole batch is rejected with the errors of each bad item. Events are
+    then created concurrently, paced by the Nylas client's rate limiter, and
+    each meeting gets its own result. Meetings with an `idempotency_key` are
+    created at most once per grant, so a failed or timed-out import can simply
+    be sent again: already-created meetings come back as "existing" and only
+    the rest are retried.
+    """
+    if not request.meetings:
+        raise HTTPException(status_code=400, detail="meetings must not be empty.")
+    if len(request.meetings) > MAX_SCHEDULE_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SCHEDULE_BATCH_SIZE} meetings can be scheduled at once.")
+
+    prepared, errors, seen_keys = [], [], set()
+    for index, item in enumerate(request.meetings):
+        try:
+            grant_id, event_request, start_datetime_local = _build_event_request(item)
+        except ValueError as e:
+            errors.append({"index": index, "error": str(e)})
+            continue
+        if item.idempotency_key:
+            if (grant_id, item.idempotency_key) in seen_keys:
+                errors.append({"index": index, "error": f"Duplicate idempotency_key: {item.idempotency_key}"})
+                continue
+            seen_keys.add((grant_id, item.idempotency_key))
+        prepared.append((index, item, grant_id, event_request, start_datetime_local))
+
+    if errors:
+        raise HTTPException(status_code=422, detail={"message": "No meetings were scheduled.", "errors": errors})
+
+    results = await asyncio.gather(*(_schedule_batch_item(*args) for args in prepared))
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    return {"counts": counts, "results": results}
+
+
+
+@app.post("/grants")
+async def add_scheduler_grant(request: GrantRequest):
+    """
+    Adds a grant whose calendar the scheduler should watch. One of the
+    scheduler replicas picks it up within a rebalance period.
+    """
+    await add_grant(request.grant_id, request.calendar_id)
+    return {"message": f"Grant {request.grant_id} will be scheduled.", "calendar_id": request.calendar_id}
+
+@app.delete("/grants/{grant_id}")
+async def remove_scheduler_grant(grant_id: str):
+    """
+    Stops the scheduler from watching a grant's calendar.
+    """
+    result = await deactivate_grant(grant_id)
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Grant not found.")
+    return {"message": f"Grant {grant_id} will no longer be scheduled."}
+
+
+
+def _etag_matches(if_none_match: str, etag: str, exists: bool) -> bool:
+    """
+    Evaluates If-None-Match with the weak comparison RFC 9110 requires, so
+    tags weakened by compressing proxies (W/"...") still match; `*` matches
+    any existing result.
+    """
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    if "*" in tags:
+        return exists
+    return etag in [tag[2:] if tag.startswith("W/") else tag for tag in tags]
 
 
 @app.get("/media/{notetaker_id}")
-async def get_media_status(notetaker_id: str):
+async def get_media_status(
+    notetaker_id: str,
+    include_transcript: bool = False,
+    if_none_match: Optional[str] = Header(None),
+):
     """
     Checks the status by fetching the result from MongoDB.
+
+    Only the status fields are returned unless `include_transcript=true`.
+    Responses carry an ETag derived from the result's version, so polling
+    clients can send `If-None-Match` and get a 304 until something changes.
     """
-    db_result = await get_media_result(notetaker_id)
-    
+    # The status lookup is cached and cheap; it is all we need to answer a
+    # conditional request, even when the transcript was asked for.
+    status_result = await get_media_result(notetaker_id)
+    version = status_result.get("version", 0) if status_result else 0
+    etag = f'"{version}-{"full" if include_transcript else "status"}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if if_none_match and _etag_matches(if_none_match, etag, status_result is not None):
+        return Response(status_code=304, headers=headers)
+
+    db_result = await get_media_result(notetaker_id, include_transcript=True) if include_transcript else status_result
+    if db_result and include_transcript and "transcript_ref" in db_result:
+        db_result["transcript"] = await load_transcript(notetaker_id)
     if db_result:
         # We remove the internal MongoDB '_id' before sending the response
-        db_result.pop("_id", None) 
-        return db_result
+        db_result.pop("_id", None)
+        db_result.setdefault("status", "processing")
+        if db_result.get("s3_folder_url"):
+            # s3_folder_url is a console link; this lists downloadable assets.
+            db_result["assets_url"] = f"/recordings/{notetaker_id}/assets"
+        return JSONResponse(jsonable_encoder(db_result), headers=headers)
     else:
-        return {"status": "processing"}
+        return JSONResponse({"status": "processing"}, headers=headers)
+
+@app.get("/media/{notetaker_id}/transcript")
+async def get_transcript_segments(
+    notetaker_id: str,
+    start_ms: Optional[int] = Query(None, ge=0),
+    end_ms: Optional[int] = Query(None, ge=0),
+    speaker: Optional[str] = None,
+):
+    """
+    Returns the transcript segments within a time range (in milliseconds)
+    and/or spoken by one speaker, without loading the whole transcript.
+    """
+    if start_ms is not None and end_ms is not None and end_ms < start_ms:
+        raise HTTPException(status_code=400, detail="end_ms must not be before start_ms.")
+
+    segments = await read_transcript_segments(notetaker_id, start_ms, end_ms, speaker)
+    if segments is None:
+        raise HTTPException(status_code=404, detail="No transcript stored for this notetaker.")
+    return {"notetaker_id": notetaker_id, "segments": segments}
+
+@app.get("/search")
+async def search_transcript_segments(
+    q: str = Query(..., min_length=1),
+    speaker: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    segments_per_meeting: int = Query(5, ge=1, le=50),
+):
+    """
+    Searches every indexed transcript. Returns the matching notetakers, best
+    first, each with its top matching segments' timestamps and speakers.
+    """
+    results = await search_transcripts(q, speaker, limit, segments_per_meeting)
+    return {"query": q, "results": results}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: per-stage latency histograms, bytes moved, in-flight jobs, queue depth and event-loop lag."""
+    return Response(content=await render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/webhook")
+async def nylas_webhook_challenge(challenge: str):
+    """
+    Answers the challenge Nylas sends when the webhook is registered.
+    """
+    return PlainTextResponse(challenge)
 
-# The webhook endpoint remains unchanged
 @app.post("/webhook")
-async def nylas_webhook(payload: dict):
+async def nylas_webhook(request: Request):
+    """
+    Receives Nylas notetaker and calendar events. Notetaker events advance the
+    notetaker's state, which starts the media pipeline as soon as its media is
+    available; calendar events update the scheduler's upcoming-meetings cache.
+    """
+    if not NYLAS_WEBHOOK_SECRET:
+        raise HTTPException(status_code=500, detail="Webhook secret is not configured.")
+
+    raw_body = await request.body()
+    if not verify_webhook_signature(raw_body, request.headers.get("x-nylas-signature")):
+        raise HTTPException(status_code=401, detail="Invalid webhook signature.")
+
+    try:
+        event = json.loads(raw_body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Webhook body is not valid JSON.")
+
+    await handle_webhook_event(event)
     return {"status": "received"}
 
 
 
 @app.get("/recordings")
-async def list_recordings():
+async def list_all_recordings(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+):
+    """
+    Lists recordings from the catalog, one entry per notetaker, newest first.
+    Pass the returned `next_cursor` back as `cursor` to fetch the next page.
+    """
+    try:
+        recordings, next_cursor = await list_recordings(limit, cursor, status, created_after, created_before)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    recordings_list = []
+    for recording in recordings:
+        audio_key = recording.get("audio_key")
+        recordings_list.append({
+            "notetaker_id": recording["_id"],
+            "status": recording.get("status"),
+            "created_at": recording["created_at"],
+            "updated_at": recording.get("updated_at"),
+            "asset_count": recording.get("asset_count", 0),
+            "asset_counts": recording.get("asset_counts", {}),
+            "total_bytes": recording.get("total_bytes", 0),
+            "audio_url": (await get_presigned_url(audio_key))[0] if audio_key else None,
+        })
+
+    return {"recordings": recordings_list, "next_cursor": next_cursor}
+
+
+@app.get("/recordings/{notetaker_id}/assets")
+async def list_recording_assets(notetaker_id: str):
+    """
+    Lists every S3 object stored for a notetaker.
+    """
+    assets = await list_assets(notetaker_id)
+    if not assets:
+        raise HTTPException(status_code=404, detail="No assets found for this notetaker.")
+    return {"assets": [
+        {
+            "filename": asset["_id"],
+            "kind": asset["kind"],
+            "content_type": asset.get("content_type"),
+            "size_bytes": asset["size"],
+            "created_at": asset["created_at"],
+            "download_url": f"/recordings/{notetaker_id}/assets/{asset['_id'].rsplit('/', 1)[-1]}",
+        }
+        for asset in assets
+    ]}
+
+
+async def _presign_asset(notetaker_id: str, filename: str) -> tuple:
+    object_name = f"recordings/{notetaker_id}/{filename}"
+    if "/" in filename or await get_asset(object_name) is None:
+        raise HTTPException(status_code=404, detail="Asset not found.")
+    return await get_presigned_url(object_name)
+
+
+@app.get("/recordings/{notetaker_id}/assets/{filename}/url")
+async def get_recording_asset_url(notetaker_id: str, filename: str):
+    """
+    Returns a short-lived presigned S3 URL for one asset. The URL accepts
+    `Range` requests, so players can stream and seek without the bytes
+    passing through the API.
+    """
+    url, expires_at = await _presign_asset(notetaker_id, filename)
+    return {"url": url, "expires_at": expires_at}
+
+
+@app.get("/recordings/{notetaker_id}/assets/{filename}")
+async def download_recording_asset(notetaker_id: str, filename: str):
+    """
+    Redirects (307) to a presigned S3 URL for one asset. Clients repeat the
+    request, including any `Range` header, against S3.
+    """
+    url, _ = await _presign_asset(notetaker_id, filename)
+    # Don't let intermediaries cache the redirect past the URL's lifetime.
+    return RedirectResponse(url, status_code=307, headers={"Cache-Control": "private, no-store"})
+
+
+@app.post("/recordings/reindex")
+async def reindex_recordings(background_tasks: BackgroundTasks):
     """
-    Lists all recordings stored in the S3 bucket.
+    Adds objects that are already in the S3 bucket to the recordings catalog.
+    Runs in the background; safe to call more than once.
     """
     if not AWS_S3_BUCKET_NAME:
         raise HTTPException(status_code=500, detail="AWS S3 bucket name is not configured.")
-
-    try:
-        # List objects within the "recordings/" folder (prefix)
-        response = s3_client.list_objects_v2(
-            Bucket=AWS_S3_BUCKET_NAME,
-            Prefix="recordings/"
-        )
-
-        if 'Contents' not in response:
-            return {"message": "No recordings found in the bucket."}
-
-        # Create a list of recordings with their S3 URLs
-        recordings_list = []
-        for item in response['Contents']:
-            key = item['Key']
-            # Ignore the folder itself if it appears in the list
-            if key == "recordings/":
-                continue
-            
-            s3_url = f"https://{AWS_S3_BUCKET_NAME}.s3.{s3_client.meta.region_name}.amazonaws.com/{key}"
-            recordings_list.append({
-                "filename": key,
-                "url": s3_url,
-                "last_modified": item['LastModified'],
-                "size_bytes": item['Size']
-            })
-
-        return {"recordings": recordings_list}
-
-    except ClientError as e:
-        error_code = e.response.get("Error", {}).get("Code")
-        print(f"An S3 error occurred: {error_code}")
-        raise HTTPException(status_code=500, detail=f"An error occurred while accessing S3: {error_code}")
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-        raise HTTPException(status_code=500, detail="An unexpected error occurred.")
+    background_tasks.add_task(backfill_catalog_from_s3)
+    return {"message": "Catalog backfill started."}
     
 
 
@@ -204,5 +522,40 @@ async def delete_recording(notetaker_id: str):
         raise HTTPException(status_code=500, detail=f"An error occurred during deletion: {str(e)}")
 
 
+@app.post("/recordings/bulk-delete", status_code=202)
+async def bulk_delete_recordings(request: BulkDeleteRequest):
+    """
+    Deletes many recordings (S3 folders and MongoDB records) in the background.
+    Follow progress at /recordings/sweeps/{sweep_id}.
+    """
+    notetaker_ids = list(dict.fromkeys(request.notetaker_ids))
+    if not notetaker_ids:
+        raise HTTPException(status_code=400, detail="No notetaker IDs given.")
+    if len(notetaker_ids) > MAX_BULK_DELETE_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_DELETE_IDS} notetaker IDs per request.")
+
+    sweep_id = await start_bulk_deletion(notetaker_ids)
+    return {"sweep_id": sweep_id, "recordings": len(notetaker_ids)}
+
+
+@app.post("/recordings/retention-sweep", status_code=202)
+async def start_recordings_retention_sweep(older_than_days: int = Query(..., ge=1)):
+    """
+    Deletes every recording older than `older_than_days` days in the background.
+    Follow progress at /recordings/sweeps/{sweep_id}.
+    """
+    sweep_id = await start_retention_sweep(older_than_days)
+    return {"sweep_id": sweep_id, "older_than_days": older_than_days}
 
 
+@app.get("/recordings/sweeps/{sweep_id}")
+async def get_recordings_sweep(sweep_id: str):
+    """
+    Reports the progress of a bulk deletion or retention sweep.
+    """
+    sweep = await get_deletion_sweep(sweep_id)
+    if not sweep:
+        raise HTTPException(status_code=404, detail="Sweep not found.")
+    sweep["sweep_id"] = sweep.pop("_id")
+    sweep.get("params", {}).pop("notetaker_ids", None)
+    return sweep
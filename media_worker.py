@@ -0,0 +1,120 @@
+import os
+import asyncio
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from metrics import observe_stage, track_in_flight, MEDIA_QUEUE_DEPTH
+from admission import PrioritySemaphore, PRIORITY_VIDEO
+
+# --- Configuration ---
+# Leave one core free for the API's event loop by default.
+MEDIA_WORKER_PROCESSES = int(os.getenv("MEDIA_WORKER_PROCESSES", str(max((os.cpu_count() or 2) - 1, 1))))
+# How many jobs may wait for a free worker before new ones are rejected.
+MEDIA_MAX_QUEUED_JOBS = int(os.getenv("MEDIA_MAX_QUEUED_JOBS", "50"))
+# Wall-clock limit for a single job once it has started running.
+MEDIA_JOB_TIMEOUT_SECONDS = int(os.getenv("MEDIA_JOB_TIMEOUT_SECONDS", "1800"))
+
+
+class MediaQueueFullError(Exception):
+    """Raised when too many media jobs are already waiting for a worker."""
+
+
+class MediaJobTimeoutError(Exception):
+    """Raised when a media job runs longer than its timeout."""
+
+
+_executor = None
+# One slot per worker process, so a submitted job starts immediately and its
+# timeout only covers the time it actually spends running. Waiting jobs are
+# started in priority order.
+_job_slots = PrioritySemaphore(MEDIA_WORKER_PROCESSES)
+_queued_jobs = 0
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # "spawn" keeps the workers from inheriting the API's event loop,
+        # threads and open Mongo/S3 connections through fork().
+        _executor = ProcessPoolExecutor(
+            max_workers=MEDIA_WORKER_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        print(f"⚙️ Media worker pool started with {MEDIA_WORKER_PROCESSES} processes.")
+    return _executor
+
+
+def _terminate_executor():
+    """Kills every worker process and discards the pool; a new one is created on demand."""
+    global _executor
+    if _executor is None:
+        return
+    executor, _executor = _executor, None
+    # A stuck decoder can't be cancelled from the outside, so the worker
+    # processes are killed outright. Jobs running alongside it fail with
+    # BrokenProcessPool and are retried by their callers.
+    for process in list(executor._processes.values()):
+        process.terminate()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def queued_job_count() -> int:
+    """Returns the number of media jobs waiting for a free worker."""
+    return _queued_jobs
+
+
+MEDIA_QUEUE_DEPTH.set_function(queued_job_count)
+
+
+async def run_media_job(
+    func, *args, timeout: int = MEDIA_JOB_TIMEOUT_SECONDS, priority: int = PRIORITY_VIDEO, **kwargs
+):
+    """
+    Runs a CPU-heavy media function in the worker process pool.
+
+    Args:
+        func: A module-level (picklable) function, e.g. from video_processor.
+        *args, **kwargs: Arguments passed to `func`. They and the return value
+            must be picklable, so pass file paths rather than large buffers.
+        timeout: Seconds the job may run before its worker is killed.
+        priority: Jobs waiting for a worker are started lowest value first
+            (see the PRIORITY_* constants in admission).
+
+    Returns:
+        The return value of `func`.
+
+    Raises:
+        MediaQueueFullError: If MEDIA_MAX_QUEUED_JOBS jobs are already waiting.
+        MediaJobTimeoutError: If the job ran longer than `timeout` seconds.
+    """
+    global _queued_jobs
+    if _queued_jobs >= MEDIA_MAX_QUEUED_JOBS:
+        raise MediaQueueFullError(f"{_queued_jobs} media jobs are already queued.")
+
+    _queued_jobs += 1
+    try:
+        with observe_stage("media_queue_wait"):
+            await _job_slots.acquire(priority=priority)
+    finally:
+        _queued_jobs -= 1
+
+    try:
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(_get_executor(), functools.partial(func, *args, **kwargs))
+        try:
+            with observe_stage(func.__name__), track_in_flight(f"media_{func.__name__}"):
+                return await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"❌ Media job {func.__name__} timed out after {timeout}s. Restarting worker pool.")
+            _terminate_executor()
+            raise MediaJobTimeoutError(f"{func.__name__} timed out after {timeout}s.")
+    finally:
+        _job_slots.release()
+
+
+def shutdown_media_worker():
+    """Stops the worker pool, waiting for running jobs to finish."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
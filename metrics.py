@@ -0,0 +1,111 @@
+"""
+Prometheus instrumentation shared by the API and the job worker.
+
+Stages are timed with `observe_stage`, which feeds one histogram labelled by
+stage name; bytes moved, in-flight jobs, queue depth and event-loop lag are
+counters and gauges next to it. Mongo commands are timed by a pymongo command
+listener, so every read and write is covered without touching each query;
+pymongo is only imported when the listener is created, with the Mongo client.
+"""
+import os
+import time
+import asyncio
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram, generate_latest
+
+# How often the event-loop lag probe wakes up.
+EVENT_LOOP_LAG_INTERVAL_SECONDS = float(os.getenv("EVENT_LOOP_LAG_INTERVAL_SECONDS", "0.5"))
+
+# Buckets from 5ms (Mongo writes) to 30 minutes (screenshot extraction of a long meeting).
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+STAGE_SECONDS = Histogram(
+    "nylas_stage_duration_seconds", "Time spent in each pipeline stage.",
+    ["stage", "outcome"], buckets=STAGE_BUCKETS,
+)
+BYTES_TRANSFERRED = Counter(
+    "nylas_bytes_transferred_total", "Bytes moved, by direction.", ["direction"]
+)
+JOBS_IN_FLIGHT = Gauge(
+    "nylas_jobs_in_flight", "Jobs currently being processed, by kind.", ["kind"]
+)
+# Cluster-wide, so it is refreshed from Mongo when the API's /metrics is scraped.
+JOB_QUEUE_DEPTH = Gauge(
+    "nylas_job_queue_depth", "Durable jobs waiting to run, by status.", ["status"]
+)
+MEDIA_QUEUE_DEPTH = Gauge(
+    "nylas_media_queue_depth", "Media jobs waiting for a free worker process."
+)
+EVENT_LOOP_LAG = Gauge(
+    "nylas_event_loop_lag_seconds", "How late the event loop last woke up from a timed sleep."
+)
+
+MONGO_WRITE_COMMANDS = {"insert", "update", "delete", "findAndModify", "createIndexes"}
+
+
+@contextmanager
+def observe_stage(stage: str):
+    """Records the duration of the enclosed block, with whether it raised."""
+    started_at = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        STAGE_SECONDS.labels(stage, outcome).observe(time.perf_counter() - started_at)
+
+
+def count_bytes(direction: str, size: int):
+    if size:
+        BYTES_TRANSFERRED.labels(direction).inc(size)
+
+
+@contextmanager
+def track_in_flight(kind: str):
+    gauge = JOBS_IN_FLIGHT.labels(kind)
+    gauge.inc()
+    try:
+        yield
+    finally:
+        gauge.dec()
+
+
+def _observe_mongo_command(event, outcome: str):
+    stage = "mongo_write" if event.command_name in MONGO_WRITE_COMMANDS else "mongo_read"
+    STAGE_SECONDS.labels(stage, outcome).observe(event.duration_micros / 1_000_000)
+
+
+def mongo_command_listener():
+    """Returns a pymongo command listener that times every command as the `mongo_write` or `mongo_read` stage."""
+    from pymongo import monitoring
+
+    class MongoCommandMetrics(monitoring.CommandListener):
+        def started(self, event):
+            pass
+
+        def succeeded(self, event):
+            _observe_mongo_command(event, "ok")
+
+        def failed(self, event):
+            _observe_mongo_command(event, "error")
+
+    return MongoCommandMetrics()
+
+
+async def monitor_event_loop_lag():
+    """Keeps EVENT_LOOP_LAG up to date until cancelled."""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + EVENT_LOOP_LAG_INTERVAL_SECONDS
+        await asyncio.sleep(EVENT_LOOP_LAG_INTERVAL_SECONDS)
+        EVENT_LOOP_LAG.set(max(loop.time() - expected, 0.0))
+
+
+async def render_metrics() -> bytes:
+    """Refreshes the gauges that are read on demand and returns the exposition text."""
+    # Imported here because database itself imports this module.
+    from database import count_jobs_by_status
+
+    for status, count in (await count_jobs_by_status()).items():
+        JOB_QUEUE_DEPTH.labels(status).set(count)
+    return generate_latest()
@@ -0,0 +1,203 @@
+"""
+Async facade over the synchronous Nylas SDK client.
+
+Every call runs on a dedicated, bounded thread pool so it never blocks the
+event loop, passes through a token bucket sized to the Nylas rate limits,
+retries 429/5xx responses with jittered backoff, and coalesces identical
+concurrent lookups into a single request.
+
+The SDK is only imported when the first call runs, on the thread pool, so
+importing this module doesn't load it.
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+from operator import attrgetter
+from concurrent.futures import ThreadPoolExecutor
+from nylas_client import get_client
+from metrics import observe_stage
+
+# --- Configuration ---
+# Upper bound on Nylas requests in flight; also the size of the thread pool.
+NYLAS_MAX_CONCURRENCY = int(os.getenv("NYLAS_MAX_CONCURRENCY", "16"))
+# Sustained request rate and burst size of the token bucket.
+NYLAS_RATE_LIMIT_PER_SECOND = float(os.getenv("NYLAS_RATE_LIMIT_PER_SECOND", "10"))
+NYLAS_RATE_LIMIT_BURST = int(os.getenv("NYLAS_RATE_LIMIT_BURST", "20"))
+NYLAS_MAX_RETRIES = int(os.getenv("NYLAS_MAX_RETRIES", "4"))
+NYLAS_RETRY_BASE_SECONDS = 0.5
+NYLAS_RETRY_MAX_SECONDS = 30.0
+
+
+class TokenBucket:
+    """An asyncio token bucket: `rate` tokens per second, holding up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Waits until a token is available and takes it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+_executor = ThreadPoolExecutor(max_workers=NYLAS_MAX_CONCURRENCY, thread_name_prefix="nylas")
+_rate_limiter = TokenBucket(NYLAS_RATE_LIMIT_PER_SECOND, NYLAS_RATE_LIMIT_BURST)
+# In-flight lookups by key, shared by every caller that asks for the same thing.
+_in_flight = {}
+
+
+def _failed_before_sending(error: Exception) -> bool:
+    """True for connection failures (refused, DNS) that happen before any of the request is sent."""
+    from urllib3.exceptions import NewConnectionError
+
+    reason = error.args[0] if error.args else None
+    return isinstance(getattr(reason, "reason", reason), NewConnectionError)
+
+
+def _is_retryable(error: Exception, idempotent: bool = True) -> bool:
+    """
+    Non-idempotent calls (creating an event, inviting a bot) are only retried
+    when Nylas can't have acted on them: a 429, or a connection that was never
+    made. A 5xx or timeout may come after the request was committed, and
+    retrying it would create a duplicate.
+    """
+    from nylas.models.errors import NylasApiError, NylasSdkTimeoutError
+
+    if isinstance(error, NylasApiError):
+        return error.status_code == 429 or (idempotent and (error.status_code or 0) >= 500)
+    if not idempotent:
+        return _failed_before_sending(error)
+    # Timeouts and dropped connections (requests' errors are OSErrors)
+    return isinstance(error, (NylasSdkTimeoutError, OSError))
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """Honours Retry-After when Nylas sends one, otherwise full-jitter backoff."""
+    retry_after = (getattr(error, "headers", None) or {}).get("Retry-After")
+    if retry_after:
+        try:
+            return min(float(retry_after), NYLAS_RETRY_MAX_SECONDS)
+        except ValueError:
+            pass
+    return random.uniform(0, min(NYLAS_RETRY_BASE_SECONDS * (2 ** attempt), NYLAS_RETRY_MAX_SECONDS))
+
+
+def nylas_error_detail(error: Exception):
+    """
+    Returns the provider's message if `error` is a Nylas API error, otherwise
+    None. Checks the already-loaded SDK module, so callers can tell Nylas
+    errors apart without importing the SDK themselves.
+    """
+    errors = sys.modules.get("nylas.models.errors")
+    if errors and isinstance(error, errors.NylasApiError):
+        return str(error.provider_error or error)
+    return None
+
+
+def request_not_sent(error: Exception) -> bool:
+    """
+    True if Nylas can't have acted on a call that failed with `error`: it
+    was rejected with a 4xx, or its connection was never made. After a 5xx
+    or a timeout the request may have been committed.
+    """
+    errors = sys.modules.get("nylas.models.errors")
+    if errors and isinstance(error, errors.NylasApiError):
+        return error.status_code is not None and error.status_code < 500
+    return _failed_before_sending(error)
+
+
+def _invoke(method: str, kwargs: dict):
+    return attrgetter(method)(get_client())(**kwargs)
+
+
+async def _call(method: str, idempotent: bool = True, **kwargs):
+    """
+    Runs a blocking SDK call, e.g. "events.list", with rate limiting and
+    retries. Pass idempotent=False for calls that create something.
+    """
+    loop = asyncio.get_running_loop()
+    for attempt in range(NYLAS_MAX_RETRIES + 1):
+        await _rate_limiter.acquire()
+        try:
+            return await loop.run_in_executor(_executor, _invoke, method, kwargs)
+        except Exception as e:
+            if attempt == NYLAS_MAX_RETRIES or not _is_retryable(e, idempotent):
+                raise
+            delay = _retry_delay(e, attempt)
+            print(f"⚠️ Nylas call {method} failed ({e}); retrying in {delay:.1f}s.")
+            await asyncio.sleep(delay)
+
+
+async def _coalesced(key: tuple, method: str, **kwargs):
+    """
+    Runs `_call` once for all concurrent callers with the same key. Results
+    are not cached: the next call after it completes makes a new request.
+    """
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_call(method, **kwargs))
+        _in_flight[key] = task
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+    # Shield so one caller being cancelled doesn't cancel the others' request.
+    return await asyncio.shield(task)
+
+
+# --- Calendars and Events ---
+
+async def list_events(grant_id: str, query_params: dict):
+    """Lists one page of calendar events."""
+    with observe_stage("nylas_calendar_list"):
+        return await _coalesced(
+            ("events.list", grant_id, tuple(sorted(query_params.items()))),
+            "events.list", identifier=grant_id, query_params=query_params
+        )
+
+async def find_calendar(grant_id: str, calendar_id: str):
+    """Fetches a calendar; "primary" resolves the grant's primary calendar."""
+    with observe_stage("nylas_calendar_find"):
+        return await _coalesced(
+            ("calendars.find", grant_id, calendar_id),
+            "calendars.find", identifier=grant_id, calendar_id=calendar_id
+        )
+
+async def create_event(grant_id: str, request_body: dict, query_params: dict):
+    """Creates a calendar event."""
+    with observe_stage("nylas_create_event"):
+        return await _call("events.create", idempotent=False, identifier=grant_id, request_body=request_body, query_params=query_params)
+
+
+# --- Notetakers ---
+
+async def invite_notetaker(grant_id: str, request_body: dict):
+    """Invites a notetaker bot to a meeting."""
+    with observe_stage("nylas_invite"):
+        return await _call("notetakers.invite", idempotent=False, identifier=grant_id, request_body=request_body)
+
+async def find_notetaker(grant_id: str, notetaker_id: str):
+    """Fetches a notetaker, including its current state."""
+    with observe_stage("nylas_status_poll"):
+        return await _coalesced(
+            ("notetakers.find", grant_id, notetaker_id),
+            "notetakers.find", identifier=grant_id, notetaker_id=notetaker_id
+        )
+
+async def get_notetaker_media(grant_id: str, notetaker_id: str):
+    """Fetches the download URLs of a notetaker's recording and transcript."""
+    with observe_stage("nylas_media_lookup"):
+        return await _coalesced(
+            ("notetakers.get_media", grant_id, notetaker_id),
+            "notetakers.get_media", identifier=grant_id, notetaker_id=notetaker_id
+        )
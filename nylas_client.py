@@ -1,22 +1,34 @@
 import os
-from nylas import Client
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
 
 # --- Configuration ---
 NYLAS_API_KEY = os.environ.get("NYLAS_API_KEY")
+# Optional: grants are stored in MongoDB. If set, this grant is registered on
+# startup and used by default for manually scheduled meetings.
 NYLAS_GRANT_ID = os.environ.get("NYLAS_GRANT_ID")
 
-if not NYLAS_API_KEY or not NYLAS_GRANT_ID:
-    raise ValueError(
-        "Please set the NYLAS_API_KEY and NYLAS_GRANT_ID environment variables."
-    )
+_client = None
+_client_lock = threading.Lock()
 
-# --- Initialize the Nylas Client ---
-try:
-    client = Client(api_key=NYLAS_API_KEY)
-except Exception as e:
-    print(f"Error initializing Nylas client: {e}")
-    # Handle the error appropriately
-    client = None
\ No newline at end of file
+
+def get_client():
+    """
+    Returns the shared Nylas client, creating it on first use.
+
+    The SDK (and `requests` under it) is imported here so that importing the
+    app stays fast; API replicas that never call Nylas never load it. Calls
+    arrive from the nylas_api thread pool, hence the lock.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if not NYLAS_API_KEY:
+                    raise ValueError("Please set the NYLAS_API_KEY environment variable.")
+                from nylas import Client
+
+                _client = Client(api_key=NYLAS_API_KEY)
+    return _client
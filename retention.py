@@ -0,0 +1,131 @@
+import os
+import asyncio
+from uuid import uuid4
+from datetime import datetime, timedelta, timezone
+from database import (
+    delete_media_results, find_recordings_created_before,
+    create_deletion_sweep, update_deletion_sweep, revive_job
+)
+from s3_uploader import delete_folder_from_s3
+from job_queue import job_handler, enqueue, RetryLater
+
+# --- Configuration ---
+# Recordings are deleted in batches; each batch's S3 folders are deleted
+# concurrently and its Mongo documents with one delete_many per collection.
+DELETION_BATCH_SIZE = int(os.getenv("DELETION_BATCH_SIZE", "100"))
+DELETION_CONCURRENCY = int(os.getenv("DELETION_CONCURRENCY", "8"))
+# If set, recordings older than this many days are deleted automatically.
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "0"))
+RETENTION_SWEEP_INTERVAL_SECONDS = int(os.getenv("RETENTION_SWEEP_INTERVAL_SECONDS", str(24 * 3600)))
+# A failed retention sweep is tried again after this long instead of waiting a full interval.
+RETENTION_RETRY_SECONDS = int(os.getenv("RETENTION_RETRY_SECONDS", "900"))
+# Largest ID list accepted for one bulk deletion.
+MAX_BULK_DELETE_IDS = 1000
+
+
+async def delete_recordings(notetaker_ids: list, sweep_id: str = None) -> int:
+    """
+    Deletes the S3 folders and Mongo records of many notetakers.
+
+    Returns:
+        The number of S3 objects deleted.
+    """
+    slots = asyncio.Semaphore(DELETION_CONCURRENCY)
+
+    async def delete_folder(notetaker_id: str) -> int:
+        async with slots:
+            return await delete_folder_from_s3(notetaker_id)
+
+    deleted_objects = 0
+    for batch_start in range(0, len(notetaker_ids), DELETION_BATCH_SIZE):
+        batch = notetaker_ids[batch_start:batch_start + DELETION_BATCH_SIZE]
+        # S3 first: if it fails, the Mongo records stay and the batch is retried.
+        batch_objects = sum(await asyncio.gather(*(delete_folder(notetaker_id) for notetaker_id in batch)))
+        deleted_records = await delete_media_results(batch)
+        deleted_objects += batch_objects
+        if sweep_id:
+            await update_deletion_sweep(sweep_id, deleted_recordings=deleted_records, deleted_objects=batch_objects)
+    return deleted_objects
+
+
+async def _delete_older_than(older_than_days: int, sweep_id: str = None) -> int:
+    """Deletes every recording created more than `older_than_days` days ago."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    deleted_objects = 0
+    while notetaker_ids := await find_recordings_created_before(cutoff, DELETION_BATCH_SIZE):
+        deleted_objects += await delete_recordings(notetaker_ids, sweep_id)
+    return deleted_objects
+
+
+async def start_bulk_deletion(notetaker_ids: list) -> str:
+    """Queues a background deletion of the given notetakers. Returns the sweep ID."""
+    sweep_id = uuid4().hex
+    await create_deletion_sweep(sweep_id, "bulk", {"notetaker_ids": notetaker_ids})
+    await enqueue(f"sweep:{sweep_id}", "deletion_sweep", {"sweep_id": sweep_id, "notetaker_ids": notetaker_ids})
+    return sweep_id
+
+
+async def start_retention_sweep(older_than_days: int) -> str:
+    """Queues a background deletion of recordings older than N days. Returns the sweep ID."""
+    sweep_id = uuid4().hex
+    await create_deletion_sweep(sweep_id, "retention", {"older_than_days": older_than_days})
+    await enqueue(f"sweep:{sweep_id}", "deletion_sweep", {"sweep_id": sweep_id, "older_than_days": older_than_days})
+    return sweep_id
+
+
+async def _record_sweep_failure(payload: dict, error: str):
+    await update_deletion_sweep(payload["sweep_id"], status="failed", error=error)
+
+
+@job_handler("deletion_sweep", on_dead_letter=_record_sweep_failure)
+async def run_deletion_sweep(payload: dict):
+    """
+    Job handler: runs a bulk or retention deletion sweep. Retries are safe;
+    already deleted recordings are simply not found again.
+    """
+    sweep_id = payload["sweep_id"]
+    await update_deletion_sweep(sweep_id, status="running")
+    if "notetaker_ids" in payload:
+        await delete_recordings(payload["notetaker_ids"], sweep_id)
+    else:
+        await _delete_older_than(payload["older_than_days"], sweep_id)
+    await update_deletion_sweep(sweep_id, status="done")
+    print(f"🧹 Deletion sweep {sweep_id} finished.")
+
+
+async def schedule_retention():
+    """
+    Queues the recurring retention job if RETENTION_DAYS is set, reviving it
+    if it was dead-lettered (e.g. after its workers kept dying mid-sweep).
+    """
+    if RETENTION_DAYS > 0:
+        if not await enqueue("retention:periodic", "periodic_retention", {}) and await revive_job("retention:periodic"):
+            print("🧹 Revived the periodic retention job.")
+
+
+@job_handler("periodic_retention")
+async def run_periodic_retention(payload: dict):
+    """
+    Job handler: applies RETENTION_DAYS, recording each run as a "periodic"
+    deletion sweep, then re-queues itself. Being a single durable job, it runs
+    on one replica at a time. A failed run is retried after
+    RETENTION_RETRY_SECONDS rather than counted as a failed attempt, so the
+    job is never dead-lettered.
+    """
+    # Stays queued even while retention is switched off on this worker, so it
+    # resumes if RETENTION_DAYS is set again.
+    if RETENTION_DAYS <= 0:
+        raise RetryLater(RETENTION_SWEEP_INTERVAL_SECONDS)
+
+    sweep_id = uuid4().hex
+    await create_deletion_sweep(sweep_id, "periodic", {"older_than_days": RETENTION_DAYS})
+    try:
+        await update_deletion_sweep(sweep_id, status="running")
+        deleted_objects = await _delete_older_than(RETENTION_DAYS, sweep_id)
+    except Exception as e:
+        print(f"❌ Retention sweep {sweep_id} failed: {e}")
+        await update_deletion_sweep(sweep_id, status="failed", error=str(e))
+        raise RetryLater(RETENTION_RETRY_SECONDS)
+    await update_deletion_sweep(sweep_id, status="done")
+    print(f"🧹 Retention sweep {sweep_id} deleted {deleted_objects} S3 objects older than {RETENTION_DAYS} days.")
+    raise RetryLater(RETENTION_SWEEP_INTERVAL_SECONDS)
@@ -1,6 +1,11 @@
 import os
-import boto3
-from botocore.exceptions import NoCredentialsError
+import asyncio
+import hashlib
+import threading
+from datetime import datetime, timedelta, timezone
+from cache import TTLCache
+from database import record_asset, settle_backfilled_recordings
+from metrics import observe_stage, count_bytes
 
 # Load AWS credentials and region from environment variables
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
@@ -8,39 +13,229 @@ AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 AWS_S3_BUCKET_NAME = os.getenv("AWS_S3_BUCKET_NAME")
 AWS_REGION = os.getenv("AWS_REGION")
 
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-    region_name=AWS_REGION
+# --- Upload Tuning ---
+# Maximum number of S3 requests in flight at once. This also sizes the boto3
+# connection pool, so concurrent uploads never wait on a free connection.
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", "10"))
+# Files at or above this size are sent as multipart uploads.
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD_MB", "16")) * 1024 * 1024
+# S3 requires every part except the last to be at least 5 MB.
+S3_MULTIPART_PART_SIZE = max(int(os.getenv("S3_MULTIPART_PART_SIZE_MB", "8")), 5) * 1024 * 1024
+
+# --- Presigned URLs ---
+# Lifetime of presigned download URLs.
+S3_PRESIGNED_URL_SECONDS = int(os.getenv("S3_PRESIGNED_URL_SECONDS", "900"))
+# A cached URL is reused until it has this much validity left, so clients
+# always get enough time to start (and seek around in) a download.
+S3_PRESIGNED_URL_MIN_REMAINING_SECONDS = int(os.getenv("S3_PRESIGNED_URL_MIN_REMAINING_SECONDS", "120"))
+_presigned_urls = TTLCache(
+    maxsize=10000, ttl=max(S3_PRESIGNED_URL_SECONDS - S3_PRESIGNED_URL_MIN_REMAINING_SECONDS, 0)
 )
 
-async def upload_file_to_s3(file_content: bytes, object_name: str, content_type: str) -> str:
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+
+def get_s3_client():
     """
-    Uploads file content to a specific path in an S3 bucket.
+    Returns the shared boto3 S3 client, creating it on first use.
 
-    Args:
-        file_content: The binary content of the file.
-        object_name: The full path for the object in S3 (e.g., 'folder/file.mp3').
-        content_type: The MIME type of the file.
+    boto3 is imported here rather than at module level so processes that
+    never touch S3 (e.g. API replicas serving only /media) don't pay for it.
+    Creating the client imports boto3 and may resolve credentials, so it is
+    only called from worker threads (see `_call_s3`), never on the event
+    loop; the lock matters because boto3 client creation isn't thread-safe.
+    """
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                import boto3
+                from botocore.config import Config
+
+                _s3_client = boto3.client(
+                    's3',
+                    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+                    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+                    region_name=AWS_REGION,
+                    config=Config(max_pool_connections=S3_MAX_CONCURRENCY)
+                )
+    return _s3_client
+
+_s3_request_slots = asyncio.Semaphore(S3_MAX_CONCURRENCY)
+
+
+async def _call_s3(func, *args, **kwargs):
+    """Runs a blocking boto3 call in a worker thread, bounded by the request pool."""
+    async with _s3_request_slots:
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+
+def _client_call_sync(method: str, kwargs: dict):
+    return getattr(get_s3_client(), method)(**kwargs)
+
+
+async def _call_s3_client(method: str, **kwargs):
+    """Calls a method of the S3 client in a worker thread, creating the client there if needed."""
+    return await _call_s3(_client_call_sync, method, kwargs)
+
+
+def _list_pages_sync(bucket: str, prefix: str, page_size: int = None):
+    """Returns a lazy iterator over the listing pages of a prefix; each `next` is one request."""
+    pagination = {"PageSize": page_size} if page_size else {}
+    paginator = get_s3_client().get_paginator("list_objects_v2")
+    return iter(paginator.paginate(Bucket=bucket, Prefix=prefix, PaginationConfig=pagination))
+
+
+# --- Upload Engine ---
+# An upload source is either the file content itself (bytes) or the path of a
+# file on local disk. Paths are read lazily, one part at a time.
+
+def _is_buffer(source) -> bool:
+    return isinstance(source, (bytes, bytearray, memoryview))
+
+
+def _source_size(source) -> int:
+    if _is_buffer(source):
+        return len(source)
+    return os.path.getsize(source)
+
+
+def _read_part(source, offset: int, size: int) -> bytes:
+    if _is_buffer(source):
+        return bytes(memoryview(source)[offset:offset + size])
+    with open(source, "rb") as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+def _put_object_sync(bucket: str, source, object_name: str, content_type: str, metadata: dict):
+    if _is_buffer(source):
+        return get_s3_client().put_object(Bucket=bucket, Key=object_name, Body=source, ContentType=content_type, Metadata=metadata)
+    with open(source, "rb") as f:
+        return get_s3_client().put_object(Bucket=bucket, Key=object_name, Body=f, ContentType=content_type, Metadata=metadata)
+
+
+def _upload_part_sync(bucket: str, source, object_name: str, upload_id: str, part_number: int, offset: int, size: int) -> dict:
+    response = get_s3_client().upload_part(
+        Bucket=bucket,
+        Key=object_name,
+        UploadId=upload_id,
+        PartNumber=part_number,
+        Body=_read_part(source, offset, size)
+    )
+    return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+
+async def _multipart_upload(bucket: str, source, object_name: str, content_type: str, metadata: dict, size: int):
+    """Uploads a large source as a multipart upload, sending its parts in parallel."""
+    upload = await _call_s3_client(
+        "create_multipart_upload",
+        Bucket=bucket, Key=object_name, ContentType=content_type, Metadata=metadata
+    )
+    upload_id = upload["UploadId"]
+
+    try:
+        part_uploads = [
+            _call_s3(
+                _upload_part_sync, bucket, source, object_name, upload_id,
+                part_number, offset, min(S3_MULTIPART_PART_SIZE, size - offset)
+            )
+            for part_number, offset in enumerate(range(0, size, S3_MULTIPART_PART_SIZE), start=1)
+        ]
+        parts = await asyncio.gather(*part_uploads)
+
+        await _call_s3_client(
+            "complete_multipart_upload",
+            Bucket=bucket, Key=object_name, UploadId=upload_id,
+            MultipartUpload={"Parts": parts}
+        )
+    except BaseException:
+        # Abort so S3 doesn't keep (and bill for) the orphaned parts.
+        await _call_s3_client("abort_multipart_upload", Bucket=bucket, Key=object_name, UploadId=upload_id)
+        raise
+
+
+# --- Recordings Catalog ---
+
+def parse_recording_key(object_name: str):
+    """
+    Splits a `recordings/{notetaker_id}/{filename}` key.
 
     Returns:
-        The S3 URL of the uploaded object.
+        A (notetaker_id, kind) tuple, or None for keys outside a recording folder.
     """
+    parts = object_name.split("/")
+    if len(parts) != 3 or parts[0] != "recordings" or not parts[2]:
+        return None
+    filename = parts[2]
+    if filename.startswith("audio."):
+        kind = "audio"
+    elif filename.startswith("transcript."):
+        kind = "transcript"
+    elif filename.startswith("screenshot_"):
+        kind = "screenshot"
+    elif filename.startswith("sprite_"):
+        kind = "sprite"
+    elif filename.startswith("thumbnails."):
+        kind = "thumbnail_index"
+    else:
+        kind = "other"
+    return parts[1], kind
+
+
+async def _catalog(object_name: str, content_type: str, size: int, created_at=None):
+    recording_key = parse_recording_key(object_name)
+    if recording_key:
+        notetaker_id, kind = recording_key
+        await record_asset(object_name, notetaker_id, kind, content_type, size, created_at)
+
+
+async def backfill_catalog_from_s3() -> int:
+    """
+    Adds every object already under `recordings/` in the bucket to the
+    catalog, e.g. after first deploying it, with each recording's status
+    taken from its saved result. Safe to run more than once.
+
+    Returns:
+        The number of objects cataloged.
+    """
+    AWS_S3_BUCKET_NAME = os.getenv("AWS_S3_BUCKET_NAME")
+    pages = await _call_s3(_list_pages_sync, AWS_S3_BUCKET_NAME, "recordings/")
+    count = 0
+    while (page := await _call_s3(next, pages, None)) is not None:
+        notetaker_ids = set()
+        for item in page.get("Contents", []):
+            # Listings don't include the content type; it's only used for display.
+            await _catalog(item["Key"], None, item["Size"], item["LastModified"])
+            recording_key = parse_recording_key(item["Key"])
+            if recording_key:
+                notetaker_ids.add(recording_key[0])
+            count += 1
+        if notetaker_ids:
+            await settle_backfilled_recordings(list(notetaker_ids))
+    print(f"✅ Cataloged {count} existing S3 objects.")
+    return count
+
+
+async def _upload(source, object_name: str, content_type: str, metadata: dict = None) -> str:
     AWS_S3_BUCKET_NAME = os.getenv("AWS_S3_BUCKET_NAME")
-    if not all([s3_client, AWS_S3_BUCKET_NAME]):
+    if not AWS_S3_BUCKET_NAME:
         raise ValueError("AWS client, bucket name, and region must be configured.")
+    # Create the client (and import botocore) off the event loop.
+    await asyncio.to_thread(get_s3_client)
+    from botocore.exceptions import NoCredentialsError
 
     try:
-        s3_client.put_object(
-            Bucket=AWS_S3_BUCKET_NAME,
-            Key=object_name,
-            Body=file_content,
-            ContentType=content_type
-        )
+        size = _source_size(source)
+        with observe_stage("s3_upload"):
+            if size >= S3_MULTIPART_THRESHOLD:
+                await _multipart_upload(AWS_S3_BUCKET_NAME, source, object_name, content_type, metadata or {}, size)
+            else:
+                await _call_s3(_put_object_sync, AWS_S3_BUCKET_NAME, source, object_name, content_type, metadata or {})
+        count_bytes("upload", size)
         s3_location = f"https://{AWS_S3_BUCKET_NAME}.s3.{AWS_REGION}.amazonaws.com/{object_name}"
         print(f"✅ Uploaded to S3: {s3_location}")
-        return s3_location
     except NoCredentialsError:
         print("❌ AWS credentials not available.")
         raise
@@ -48,38 +243,185 @@ async def upload_file_to_s3(file_content: bytes, object_name: str, content_type:
         print(f"❌ Failed to upload to S3: {e}")
         raise
 
+    await _catalog(object_name, content_type, size)
+    return s3_location
 
-async def delete_folder_from_s3(notetaker_id: str):
+
+async def upload_file_to_s3(file_content: bytes, object_name: str, content_type: str) -> str:
     """
-    Deletes all objects within a folder corresponding to the notetaker_id.
+    Uploads file content to a specific path in an S3 bucket.
 
     Args:
-        notetaker_id: The unique ID of the recording session.
+        file_content: The binary content of the file.
+        object_name: The full path for the object in S3 (e.g., 'folder/file.mp3').
+        content_type: The MIME type of the file.
+
+    Returns:
+        The S3 URL of the uploaded object.
+    """
+    return await _upload(file_content, object_name, content_type)
+
+
+async def upload_path_to_s3(file_path: str, object_name: str, content_type: str, metadata: dict = None) -> str:
+    """
+    Uploads a file from local disk to a specific path in an S3 bucket.
+
+    The file is read in parts, so large recordings are never loaded into
+    memory in full.
+
+    Args:
+        file_path: The local path of the file to upload.
+        object_name: The full path for the object in S3 (e.g., 'folder/file.mp3').
+        content_type: The MIME type of the file.
+        metadata: Optional user metadata stored with the object.
+
+    Returns:
+        The S3 URL of the uploaded object.
+    """
+    return await _upload(file_path, object_name, content_type, metadata)
+
+
+def file_sha256(file_path: str) -> str:
+    """Returns the hex SHA-256 of a local file, read in chunks. Blocking."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _head_sha256_sync(bucket: str, object_name: str):
+    from botocore.exceptions import ClientError
+
+    try:
+        response = get_s3_client().head_object(Bucket=bucket, Key=object_name)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+    return response.get("Metadata", {}).get("sha256")
+
+
+async def get_object_sha256(object_name: str):
+    """
+    Returns the SHA-256 recorded in an S3 object's metadata, or None if the
+    object doesn't exist or was uploaded without one.
     """
     AWS_S3_BUCKET_NAME = os.getenv("AWS_S3_BUCKET_NAME")
-    if not all([s3_client, AWS_S3_BUCKET_NAME]):
+    return await _call_s3(_head_sha256_sync, AWS_S3_BUCKET_NAME, object_name)
+
+
+def _read_object_sync(bucket: str, object_name: str, byte_range) -> bytes:
+    kwargs = {"Bucket": bucket, "Key": object_name}
+    if byte_range:
+        kwargs["Range"] = f"bytes={byte_range[0]}-{byte_range[1]}"
+    return get_s3_client().get_object(**kwargs)["Body"].read()
+
+
+async def download_from_s3(object_name: str, byte_range: tuple = None) -> bytes:
+    """
+    Downloads an object, or only part of it, from S3.
+
+    Args:
+        object_name: The full path of the object in S3.
+        byte_range: Optional inclusive (first_byte, last_byte) range to fetch.
+
+    Returns:
+        The downloaded bytes.
+    """
+    AWS_S3_BUCKET_NAME = os.getenv("AWS_S3_BUCKET_NAME")
+    return await _call_s3(_read_object_sync, AWS_S3_BUCKET_NAME, object_name, byte_range)
+
+
+def _presign_sync(object_name: str) -> str:
+    return get_s3_client().generate_presigned_url(
+        "get_object",
+        Params={"Bucket": os.getenv("AWS_S3_BUCKET_NAME"), "Key": object_name},
+        ExpiresIn=S3_PRESIGNED_URL_SECONDS,
+    )
+
+
+async def get_presigned_url(object_name: str) -> tuple:
+    """
+    Returns a presigned GET URL for an object, so clients download it straight
+    from S3. The URL honours `Range` headers, so players can stream and seek.
+
+    URLs are cached and reused until S3_PRESIGNED_URL_MIN_REMAINING_SECONDS
+    before they expire, so each object is signed once per window. Signing
+    runs in a worker thread, since it may create the client and resolve
+    credentials; it makes no S3 request, so it doesn't take a request slot.
+
+    Returns:
+        A tuple of the URL and its expiry time (UTC).
+    """
+    cached = _presigned_urls.get(object_name)
+    if cached is not None:
+        return cached
+
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=S3_PRESIGNED_URL_SECONDS)
+    url = await asyncio.to_thread(_presign_sync, object_name)
+    _presigned_urls.set(object_name, (url, expires_at))
+    return url, expires_at
+
+
+S3_DELETE_BATCH_SIZE = 1000  # The most keys delete_objects accepts per call
+
+
+def _delete_batch_sync(bucket: str, keys: list) -> int:
+    response = get_s3_client().delete_objects(
+        Bucket=bucket,
+        Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True}
+    )
+    errors = response.get("Errors", [])
+    if errors:
+        raise RuntimeError(f"{len(errors)} objects could not be deleted, e.g. {errors[0].get('Key')}: {errors[0].get('Message')}")
+    return len(keys)
+
+
+async def delete_prefix_from_s3(prefix: str) -> int:
+    """
+    Deletes every object under a prefix, however many there are.
+
+    The listing is paginated and each page of up to 1000 keys is deleted with
+    one delete_objects call; deletes run concurrently with the listing of
+    the next pages.
+
+    Returns:
+        The number of objects deleted.
+    """
+    AWS_S3_BUCKET_NAME = os.getenv("AWS_S3_BUCKET_NAME")
+    if not AWS_S3_BUCKET_NAME:
         raise ValueError("AWS client and bucket name must be configured.")
 
-    folder_prefix = f"recordings/{notetaker_id}/"
-    
-    try:
-        # List all objects within the folder
-        objects_to_delete = s3_client.list_objects_v2(
-            Bucket=AWS_S3_BUCKET_NAME,
-            Prefix=folder_prefix
-        )
+    pages = await _call_s3(_list_pages_sync, AWS_S3_BUCKET_NAME, prefix, S3_DELETE_BATCH_SIZE)
+    deletes = []
+    while (page := await _call_s3(next, pages, None)) is not None:
+        keys = [obj["Key"] for obj in page.get("Contents", [])]
+        if keys:
+            deletes.append(asyncio.create_task(_call_s3(_delete_batch_sync, AWS_S3_BUCKET_NAME, keys)))
+    return sum(await asyncio.gather(*deletes))
 
-        if 'Contents' not in objects_to_delete:
-            print(f"No objects found in S3 for notetaker_id: {notetaker_id}")
-            return # Nothing to delete
 
-        # Prepare the list of keys to delete
-        delete_keys = {'Objects': [{'Key': obj['Key']} for obj in objects_to_delete.get('Contents', [])]}
+async def delete_folder_from_s3(notetaker_id: str) -> int:
+    """
+    Deletes all objects within a folder corresponding to the notetaker_id.
 
-        # Execute the delete operation
-        s3_client.delete_objects(Bucket=AWS_S3_BUCKET_NAME, Delete=delete_keys)
-        print(f"✅ Successfully deleted folder '{folder_prefix}' from S3.")
+    Args:
+        notetaker_id: The unique ID of the recording session.
+
+    Returns:
+        The number of objects deleted.
+    """
+    folder_prefix = f"recordings/{notetaker_id}/"
+
+    try:
+        deleted = await delete_prefix_from_s3(folder_prefix)
+        if deleted == 0:
+            print(f"No objects found in S3 for notetaker_id: {notetaker_id}")
+        else:
+            print(f"✅ Successfully deleted folder '{folder_prefix}' ({deleted} objects) from S3.")
+        return deleted
 
     except Exception as e:
         print(f"❌ Failed to delete from S3: {e}")
-        raise
\ No newline at end of file
+        raise
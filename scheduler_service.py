@@ -1,64 +1,149 @@
+import os
+import math
+import random
 import asyncio
-import time
-from datetime import datetime, timezone
-from nylas_client import client, NYLAS_GRANT_ID
-from database import is_bot_invited, mark_bot_invited
-from nylas.models.notetakers import InviteNotetakerRequest
-# 1. Import the task we need to run
-from tasks import check_and_get_media
+from typing import TYPE_CHECKING
+from nylas_client import NYLAS_GRANT_ID
+from nylas_api import invite_notetaker, request_not_sent
+from database import (
+    claim_bot_dispatch, release_bot_dispatch, mark_bot_invited, register_notetaker, add_grant, list_active_grants,
+    heartbeat_replica, count_live_replicas, remove_replica, acquire_grant_lease, release_grant_lease,
+    take_calendar_sync_flags
+)
+from tasks import watch_notetaker
+from calendar_sync import CalendarSync, request_calendar_sync
+from job_queue import WORKER_ID
+from metrics import observe_stage
 
-async def run_scheduler_check():
+if TYPE_CHECKING:
+    from nylas.models.notetakers import InviteNotetakerRequest
+
+# --- Sharding Configuration ---
+# A replica owns a grant for SCHEDULER_LEASE_SECONDS and renews the lease every
+# SCHEDULER_REBALANCE_SECONDS, so a crashed replica's grants move within a
+# lease period.
+SCHEDULER_LEASE_SECONDS = int(os.getenv("SCHEDULER_LEASE_SECONDS", "90"))
+SCHEDULER_REBALANCE_SECONDS = int(os.getenv("SCHEDULER_REBALANCE_SECONDS", "30"))
+# How often the owned grants are checked for calendar syncs requested by
+# webhooks that reached another replica.
+CALENDAR_SYNC_FLAG_POLL_SECONDS = int(os.getenv("CALENDAR_SYNC_FLAG_POLL_SECONDS", "5"))
+
+async def dispatch_bot(grant_id: str, event_id: str, meet_url: str, title: str):
     """
-    Checks for upcoming meetings and dispatches the notetaker bot, telling the
-    background task whether video was requested.
+    Sends the notetaker bot to a meeting, telling the background job whether
+    video was requested.
+
+    The event is claimed in Mongo before the invite, so at most one bot is
+    ever invited per event. Raises (so the caller retries) only when the
+    invite is known not to have reached Nylas, or when tracking an invited
+    notetaker failed; a retry then finishes the tracking without inviting
+    again.
     """
-    print("✅ Automated scheduler service started. Checking for meetings every 60 seconds.")
-    while True:
-        try:
-            now = int(time.time())
-            in_two_minutes = now + 120
+    # Define the settings here to be passed to the task
+    meeting_settings = {
+        "video_recording": False, # Set to False for audio-only
+        "audio_recording": True,
+        "transcription": True,
+        "diarization": True,
 
-            upcoming_events_response = client.events.list(
-                identifier=NYLAS_GRANT_ID,
-                query_params={"calendar_id": "primary", "start": now - 60, "end": in_two_minutes, "expand_recurring": True}
-            )
-            upcoming_events = upcoming_events_response.data
+    }
 
-            for event in upcoming_events:
-                if event.conferencing and event.conferencing.details and not await is_bot_invited(event.id):
-                    meet_url = event.conferencing.details.get("url")
-                    if not meet_url:
-                        continue
-                    
-                    print(f"🗓️ Upcoming meeting found: '{event.title}'. Dispatching bot.")
+    existing = await claim_bot_dispatch(event_id)
+    if existing is not None:
+        notetaker_id = existing.get("notetaker_id")
+        if notetaker_id is None:
+            # Another attempt is inviting the bot, or its invite may have
+            # been committed; inviting again could send a second bot.
+            return
+    else:
+        print(f"🗓️ Upcoming meeting found: '{title}'. Dispatching bot.")
+        request_body: InviteNotetakerRequest = {
+            "meeting_link": meet_url,
+            "name": "Automated Bot",
+            "meeting_settings": meeting_settings,
+        }
+        try:
+            notetaker_response = await invite_notetaker(grant_id, request_body)
+        except Exception as e:
+            if request_not_sent(e):
+                await release_bot_dispatch(event_id)
+                raise
+            print(f"❌ Invite for event {event_id} may or may not have gone through ({e}); not retrying.")
+            return
+        notetaker_id = notetaker_response.data.id
+        print(f"🤖 Bot dispatched with notetaker_id: {notetaker_id}")
+        await mark_bot_invited(event_id, notetaker_id)
 
-                    # Define the settings here to be passed to the task
-                    meeting_settings = {
-                        "video_recording": False, # Set to False for audio-only
-                        "audio_recording": True,
-                        "transcription": True,
-                        "diarization": True,
+    # Both steps are idempotent, so a retry after a failure here is safe.
+    await register_notetaker(notetaker_id, grant_id, meet_url, meeting_settings['video_recording'])
+    await watch_notetaker(notetaker_id)
 
-                    }
+async def _rebalance(owned: dict):
+    """
+    Renews the leases this replica holds and takes or sheds grants so that
+    each live replica owns about the same number of calendars.
+    """
+    await heartbeat_replica(WORKER_ID, SCHEDULER_LEASE_SECONDS)
+    grants = {grant["_id"]: grant for grant in await list_active_grants()}
+    fair_share = math.ceil(len(grants) / max(await count_live_replicas(), 1))
 
-                    request_body: InviteNotetakerRequest = {
-                        "meeting_link": meet_url,
-                        "name": "Automated Bot",
-                        "meeting_settings": meeting_settings,
-                    }
-                    notetaker_response = client.notetakers.invite(
-                        identifier=NYLAS_GRANT_ID, request_body=request_body
-                    )
-                    notetaker_id = notetaker_response.data.id
-                    print(f"🤖 Bot dispatched with notetaker_id: {notetaker_id}")
+    for grant_id in list(owned):
+        if grant_id not in grants or not await acquire_grant_lease(grant_id, WORKER_ID, SCHEDULER_LEASE_SECONDS):
+            print(f"🔀 No longer scheduling grant {grant_id}.")
+            owned.pop(grant_id).cancel()
 
-                    await mark_bot_invited(event.id, notetaker_id)
+    # Hand surplus grants back when new replicas join
+    while len(owned) > fair_share:
+        grant_id, task = owned.popitem()
+        task.cancel()
+        await release_grant_lease(grant_id, WORKER_ID)
+        print(f"🔀 Released grant {grant_id} to another replica.")
 
-                    # FIX: Pass the video_recording setting to the background task
-                    print(f"🚀 Starting status check task for {notetaker_id} (Video requested: {meeting_settings['video_recording']})")
-                    asyncio.create_task(check_and_get_media(notetaker_id, meet_url, was_video_requested=meeting_settings['video_recording']))
+    unowned = [grant_id for grant_id in grants if grant_id not in owned]
+    random.shuffle(unowned)
+    for grant_id in unowned:
+        if len(owned) >= fair_share:
+            break
+        if await acquire_grant_lease(grant_id, WORKER_ID, SCHEDULER_LEASE_SECONDS):
+            print(f"🔀 Now scheduling grant {grant_id}.")
+            sync = CalendarSync(grant_id, dispatch_bot, calendar_id=grants[grant_id].get("calendar_id", "primary"))
+            owned[grant_id] = asyncio.create_task(sync.run())
 
+async def _watch_sync_flags(owned: dict):
+    """Runs an immediate sync for owned grants whose calendar changes were flagged by other replicas."""
+    while True:
+        await asyncio.sleep(CALENDAR_SYNC_FLAG_POLL_SECONDS)
+        if not owned:
+            continue
+        try:
+            for grant_id in await take_calendar_sync_flags(list(owned)):
+                request_calendar_sync(grant_id)
         except Exception as e:
-            print(f"❌ Error in scheduler service: {e}")
+            print(f"❌ Error checking calendar sync requests: {e}")
+
+async def run_scheduler_check():
+    """
+    Shards the stored grants across scheduler replicas and, for each grant
+    this replica owns, keeps the calendar's upcoming meetings in sync and
+    dispatches the notetaker bot to each one at its start time.
+    """
+    print(f"✅ Automated scheduler service started as replica {WORKER_ID}.")
+    if NYLAS_GRANT_ID:
+        await add_grant(NYLAS_GRANT_ID)
 
-        await asyncio.sleep(60)
\ No newline at end of file
+    owned = {}
+    sync_flags = asyncio.create_task(_watch_sync_flags(owned))
+    try:
+        while True:
+            try:
+                with observe_stage("scheduler_tick"):
+                    await _rebalance(owned)
+            except Exception as e:
+                print(f"❌ Error in scheduler service: {e}")
+            await asyncio.sleep(SCHEDULER_REBALANCE_SECONDS)
+    finally:
+        sync_flags.cancel()
+        for grant_id, task in owned.items():
+            task.cancel()
+            await release_grant_lease(grant_id, WORKER_ID)
+        await remove_replica(WORKER_ID)
@@ -1,84 +1,381 @@
 import os
 import asyncio
+import shutil
+import tempfile
 import httpx
-from nylas.models.notetakers import NotetakerState
-from nylas_client import client, NYLAS_GRANT_ID
-from database import save_media_result
-from s3_uploader import upload_file_to_s3
-from video_processor import extract_audio, extract_screenshots
+from nylas_api import find_notetaker, get_notetaker_media
+from database import (
+    save_media_result, save_transcript, get_notetaker, advance_notetaker_state,
+    save_checkpoint, record_upload, replace_transcript_segments
+)
+from s3_uploader import upload_path_to_s3, file_sha256, get_object_sha256
+from media_worker import run_media_job
+from transcript_store import store_transcript, load_transcript
+from job_queue import job_handler, enqueue, RetryLater
+from metrics import observe_stage, count_bytes
+from admission import reserve_memory, network_slot, has_capacity, job_priority, PRIORITY_AUDIO_ONLY
+
+# "scene" emits a screenshot only when the picture changes; "interval" takes
+# one every SCREENSHOT_INTERVAL_SECONDS regardless of content.
+SCREENSHOT_MODE = os.getenv("SCREENSHOT_MODE", "scene")
+SCREENSHOT_INTERVAL_SECONDS = int(os.getenv("SCREENSHOT_INTERVAL_SECONDS", "10"))
+# How often scene mode samples a frame to compare.
+SCENE_SAMPLE_SECONDS = int(os.getenv("SCENE_SAMPLE_SECONDS", "1"))
+SCENE_MIN_SPACING_SECONDS = int(os.getenv("SCENE_MIN_SPACING_SECONDS", "5"))
+SCENE_MAX_SPACING_SECONDS = int(os.getenv("SCENE_MAX_SPACING_SECONDS", "120"))
+# "sprites" packs thumbnails into sprite sheets with a WebVTT/JSON index;
+# "frames" keeps one full-resolution JPEG per screenshot; "both" does both.
+SCREENSHOT_OUTPUT = os.getenv("SCREENSHOT_OUTPUT", "sprites")
+SPRITE_THUMB_WIDTH = int(os.getenv("SPRITE_THUMB_WIDTH", "160"))
+SPRITE_COLUMNS = int(os.getenv("SPRITE_COLUMNS", "10"))
+SPRITE_ROWS = int(os.getenv("SPRITE_ROWS", "10"))
+SCREENSHOT_CONTENT_TYPES = {".jpg": "image/jpeg", ".vtt": "text/vtt", ".json": "application/json"}
+# Copy the recording's audio track out without re-encoding when its codec allows.
+AUDIO_STREAM_COPY = os.getenv("AUDIO_STREAM_COPY", "true").lower() == "true"
 
 async def download_json_content(url: str):
     """Asynchronously downloads and parses JSON content from a URL."""
-    async with httpx.AsyncClient() as http_client:
-        response = await http_client.get(url)
-        response.raise_for_status()
-        return response.json()
+    with observe_stage("transcript_download"):
+        async with httpx.AsyncClient() as http_client:
+            response = await http_client.get(url)
+            response.raise_for_status()
+    count_bytes("download", len(response.content))
+    return response.json()
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MB
+
+# Working files are kept per notetaker under this directory until its pipeline
+# finishes, so a retried job on the same host can reuse them.
+MEDIA_WORK_DIR = os.getenv("MEDIA_WORK_DIR", os.path.join(tempfile.gettempdir(), "nylas-media"))
+
+def _work_dir(notetaker_id: str) -> str:
+    return os.path.join(MEDIA_WORK_DIR, notetaker_id)
+
+def _file_size(path: str):
+    return os.path.getsize(path) if os.path.exists(path) else None
+
+async def download_file_to_path(url: str, file_path: str):
+    """
+    Streams a file from a URL to disk.
+
+    Only one chunk is held in memory at a time, so memory use stays flat no
+    matter how large the recording is. The data is written to a `.part` file
+    that is renamed into place once complete, so `file_path` only ever holds
+    a finished download.
+
+    Returns:
+        A tuple of the downloaded size in bytes and the response content type.
+    """
+    part_path = f"{file_path}.part"
+    try:
+        with observe_stage("recording_download"), open(part_path, "wb") as f:
+            async with httpx.AsyncClient(timeout=120.0) as http_client:
+                async with http_client.stream("GET", url) as response:
+                    response.raise_for_status()
+                    content_type = response.headers.get('content-type', 'application/octet-stream')
+                    async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+                        count_bytes("download", len(chunk))
+        os.replace(part_path, file_path)
+    except Exception:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    return os.path.getsize(file_path), content_type
+
+async def probe_content_length(url: str):
+    """
+    Returns the size of the file at `url` without downloading it, or None if
+    the server doesn't say. A one-byte range GET is used instead of HEAD
+    because presigned media URLs are only signed for GET.
+    """
+    async with httpx.AsyncClient(timeout=30.0) as http_client:
+        async with http_client.stream("GET", url, headers={"Range": "bytes=0-0"}) as response:
+            if response.status_code == 206:
+                total = response.headers.get("content-range", "").rpartition("/")[2]
+                return int(total) if total.isdigit() else None
+            if response.status_code == 200:
+                length = response.headers.get("content-length", "")
+                return int(length) if length.isdigit() else None
+    return None
+
+async def upload_once(notetaker_id: str, file_path: str, object_name: str, content_type: str, uploaded: dict):
+    """
+    Uploads a file unless the same content already exists under `object_name`.
 
-async def download_file_content(url: str):
-    """Asynchronously downloads the raw binary content of a file from a URL."""
-    async with httpx.AsyncClient(timeout=120.0) as http_client:
-        response = await http_client.get(url)
-        response.raise_for_status()
-        return response.content, response.headers.get('content-type', 'application/octet-stream')
+    Uploads are keyed by object name and SHA-256. The hash is stored in the
+    object's metadata and recorded on the notetaker, so a retry skips objects
+    that are already in S3, even if the checkpoint write after their upload
+    was lost.
+    """
+    sha256 = await asyncio.to_thread(file_sha256, file_path)
+    if uploaded.get(object_name) == sha256:
+        return
+    if await get_object_sha256(object_name) != sha256:
+        await upload_path_to_s3(file_path, object_name, content_type, metadata={"sha256": sha256})
+    await record_upload(notetaker_id, object_name, sha256)
+    uploaded[object_name] = sha256
+
+async def upload_audio_from_video(notetaker_id: str, video_path: str, checkpoints: dict, uploaded: dict):
+    """Extracts the audio track from a video file and uploads it to S3."""
+    # Imported on first use: cv2 and moviepy are slow to load and only media jobs need them.
+    from video_processor import extract_audio, AUDIO_CONTENT_TYPES
+
+    work_dir = _work_dir(notetaker_id)
+    extracted = checkpoints.get("audio_extract")
+    audio_path = os.path.join(work_dir, extracted["file"]) if extracted else None
+    if not extracted or _file_size(audio_path) != extracted["size"]:
+        # Audio is usually a quick stream copy, so it goes ahead of screenshot extraction.
+        audio_path = await run_media_job(
+            extract_audio, video_path, work_dir, AUDIO_STREAM_COPY, priority=PRIORITY_AUDIO_ONLY
+        )
+        await save_checkpoint(notetaker_id, "audio_extract", {
+            "file": os.path.basename(audio_path), "size": os.path.getsize(audio_path)
+        })
+
+    extension = os.path.splitext(audio_path)[1]
+    await upload_once(
+        notetaker_id, audio_path, f"recordings/{notetaker_id}/audio{extension}",
+        AUDIO_CONTENT_TYPES[extension], uploaded
+    )
+    await save_checkpoint(notetaker_id, "audio")
 
-async def check_and_get_media(notetaker_id: str, meet_url: str, was_video_requested: bool):
+async def upload_screenshots_from_video(notetaker_id: str, video_path: str, checkpoints: dict, uploaded: dict):
     """
-    Checks status, processes media based on whether video was requested,
-    uploads to S3, and saves all data to MongoDB.
+    Extracts screenshots in the media worker pool, which writes them (as sprite
+    sheets and/or full frames, per SCREENSHOT_OUTPUT) to the notetaker's working
+    directory, then uploads them in one concurrent batch.
     """
-    print(f"Checking for media for notetaker: {notetaker_id}")
+    from video_processor import write_screenshots
 
-    while True:
+    output_dir = os.path.join(_work_dir(notetaker_id), "screenshots")
+    extracted = checkpoints.get("screenshot_extract")
+    if extracted and all(os.path.exists(os.path.join(output_dir, name)) for name in extracted["files"]):
+        screenshots = [os.path.join(output_dir, name) for name in extracted["files"]]
+    else:
+        if SCREENSHOT_MODE == "scene":
+            options = {
+                "sample_seconds": SCENE_SAMPLE_SECONDS,
+                "min_spacing_seconds": SCENE_MIN_SPACING_SECONDS,
+                "max_spacing_seconds": SCENE_MAX_SPACING_SECONDS,
+            }
+        else:
+            options = {"interval_seconds": SCREENSHOT_INTERVAL_SECONDS}
+
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.makedirs(output_dir)
+        screenshots = await run_media_job(
+            write_screenshots, video_path, output_dir, SCREENSHOT_MODE,
+            output=SCREENSHOT_OUTPUT,
+            thumb_width=SPRITE_THUMB_WIDTH,
+            sprite_columns=SPRITE_COLUMNS,
+            sprite_rows=SPRITE_ROWS,
+            **options,
+        )
+        await save_checkpoint(notetaker_id, "screenshot_extract", {"files": [os.path.basename(p) for p in screenshots]})
+
+    await asyncio.gather(*(
+        upload_once(
+            notetaker_id, path, f"recordings/{notetaker_id}/{os.path.basename(path)}",
+            SCREENSHOT_CONTENT_TYPES[os.path.splitext(path)[1]], uploaded
+        )
+        for path in screenshots
+    ))
+    await save_checkpoint(notetaker_id, "screenshots")
+
+async def process_recording(notetaker: dict, recording_url: str, checkpoints: dict, uploaded: dict):
+    """
+    Downloads a notetaker's recording and uploads its audio and screenshots.
+
+    The job first reserves a share of the memory budget sized to the
+    recording, then downloads it in one of the network slots; audio-only jobs
+    are admitted ahead of video ones at each step.
+    """
+    notetaker_id = notetaker["_id"]
+    recording_path = os.path.join(_work_dir(notetaker_id), "recording")
+    priority = job_priority(notetaker["video_requested"])
+
+    download = checkpoints.get("download")
+    recording_size = download["size"] if download else await probe_content_length(recording_url)
+    async with reserve_memory(recording_size, priority):
+        if download and _file_size(recording_path) == download["size"]:
+            print(f"Reusing downloaded recording for {notetaker_id}.")
+            content_type = download["content_type"]
+        else:
+            print("Downloading recording...")
+            async with network_slot(priority):
+                size, content_type = await download_file_to_path(recording_url, recording_path)
+            await save_checkpoint(notetaker_id, "download", {"size": size, "content_type": content_type})
+
+        await _process_downloaded_recording(notetaker, recording_path, content_type, checkpoints, uploaded)
+
+async def _process_downloaded_recording(
+    notetaker: dict, recording_path: str, content_type: str, checkpoints: dict, uploaded: dict
+):
+    notetaker_id = notetaker["_id"]
+
+    # FIX: Check if video was actually requested before processing it
+    if notetaker["video_requested"] and "video" in content_type:
+        print("Video processing...")
+        # A failed stage cancels the other, so a retry isn't held up by (or
+        # racing against) work left running from the failed attempt.
         try:
-            notetaker = client.notetakers.find(identifier=NYLAS_GRANT_ID, notetaker_id=notetaker_id)
-            current_state = notetaker.data.state
-            print(f"Notetaker state for {notetaker_id}: {current_state}")
-
-            if current_state == NotetakerState.MEDIA_AVAILABLE:
-                media_response = client.notetakers.get_media(identifier=NYLAS_GRANT_ID, notetaker_id=notetaker_id)
-                
-                transcript_content, s3_folder_url = None, None
-                folder_name = f"recordings/{notetaker_id}"
-                
-                # ... (transcript processing is the same) ...
-                if media_response.data.transcript and media_response.data.transcript.url:
-                    async with httpx.AsyncClient() as http_client:
-                        response = await http_client.get(media_response.data.transcript.url)
-                        response.raise_for_status()
-                        transcript_content = response.json()
-
-                if media_response.data.recording and media_response.data.recording.url:
-                    print("Downloading recording...")
-                    recording_content, content_type = await download_file_content(media_response.data.recording.url)
-                    
-                    # FIX: Check if video was actually requested before processing it
-                    if was_video_requested and "video" in content_type:
-                        print("Video processing...")
-                        audio_content = await asyncio.to_thread(extract_audio, recording_content)
-                        await upload_file_to_s3(audio_content, f"{folder_name}/audio.mp3", "audio/mpeg")
-                        
-                        screenshots = await asyncio.to_thread(extract_screenshots, recording_content)
-                        for ts, img_bytes in screenshots:
-                            await upload_file_to_s3(img_bytes, f"{folder_name}/screenshot_{ts}s.jpg", "image/jpeg")
-                    else:
-                        # Otherwise, just upload the audio directly
-                        print("Audio-only file detected. Uploading directly...")
-                        await upload_file_to_s3(recording_content, f"{folder_name}/audio.mp3", "audio/mpeg")
-                    
-                    s3_folder_url = f"https://s3.console.aws.amazon.com/s3/buckets/{os.getenv('AWS_S3_BUCKET_NAME')}?prefix={folder_name}/"
-
-                await save_media_result(notetaker_id, meet_url, transcript_data=transcript_content, s3_folder_url=s3_folder_url)
-                break
-
-            # ... (error handling is the same) ...
-            elif current_state in [NotetakerState.FAILED_ENTRY, NotetakerState.MEDIA_ERROR]:
-                error_message = f"Failed with state: {current_state.value}"
-                await save_media_result(notetaker_id, meet_url, error=error_message)
-                break
-
-            await asyncio.sleep(30)
-            
-        except Exception as e:
-            print(f"An error occurred while processing {notetaker_id}: {e}")
-            await save_media_result(notetaker_id, meet_url, error="An exception occurred during polling.")
-            break
\ No newline at end of file
+            async with asyncio.TaskGroup() as stages:
+                if "audio" not in checkpoints:
+                    stages.create_task(upload_audio_from_video(notetaker_id, recording_path, checkpoints, uploaded))
+                if "screenshots" not in checkpoints:
+                    stages.create_task(upload_screenshots_from_video(notetaker_id, recording_path, checkpoints, uploaded))
+        except ExceptionGroup as errors:
+            # Surface the stage's own error to the job queue's retry handling.
+            raise errors.exceptions[0]
+    elif "audio" not in checkpoints:
+        # Otherwise, just upload the audio directly
+        print("Audio-only file detected. Uploading directly...")
+        await upload_once(notetaker_id, recording_path, f"recordings/{notetaker_id}/audio.mp3", "audio/mpeg", uploaded)
+        await save_checkpoint(notetaker_id, "audio")
+
+async def process_available_media(notetaker: dict):
+    """
+    Fetches the transcript and recording of a notetaker whose media is ready,
+    processes them based on whether video was requested, uploads to S3, and
+    saves all data to MongoDB.
+
+    Each stage records a checkpoint on the notetaker document when it finishes,
+    so a retry resumes after the last finished stage instead of starting over.
+    """
+    notetaker_id = notetaker["_id"]
+    checkpoints = notetaker.get("checkpoints", {})
+    uploaded = {upload["key"]: upload["sha256"] for upload in notetaker.get("uploads", [])}
+    folder_name = f"recordings/{notetaker_id}"
+    os.makedirs(_work_dir(notetaker_id), exist_ok=True)
+
+    if "transcript" not in checkpoints or "recording" not in checkpoints:
+        media = (await get_notetaker_media(notetaker["grant_id"], notetaker_id)).data
+
+    if "transcript" not in checkpoints:
+        if media.transcript and media.transcript.url:
+            transcript_content = await download_json_content(media.transcript.url)
+            transcript_ref = await store_transcript(notetaker_id, transcript_content)
+            await save_transcript(notetaker_id, notetaker["meet_url"], transcript_ref)
+        await save_checkpoint(notetaker_id, "transcript")
+
+    recording = checkpoints.get("recording")
+    if recording is None:
+        has_recording = bool(media.recording and media.recording.url)
+        if has_recording:
+            await process_recording(notetaker, media.recording.url, checkpoints, uploaded)
+        recording = {"has_recording": has_recording}
+        await save_checkpoint(notetaker_id, "recording", recording)
+
+    s3_folder_url = None
+    if recording["has_recording"]:
+        s3_folder_url = f"https://s3.console.aws.amazon.com/s3/buckets/{os.getenv('AWS_S3_BUCKET_NAME')}?prefix={folder_name}/"
+
+    await save_media_result(notetaker_id, notetaker["meet_url"], s3_folder_url=s3_folder_url)
+    await enqueue(f"index:{notetaker_id}", "index_transcript", {"notetaker_id": notetaker_id})
+    shutil.rmtree(_work_dir(notetaker_id), ignore_errors=True)
+
+@job_handler("index_transcript")
+async def index_transcript(payload: dict):
+    """Job handler: makes a notetaker's stored transcript searchable."""
+    transcript = await load_transcript(payload["notetaker_id"])
+    if transcript is None:
+        return
+    await replace_transcript_segments(payload["notetaker_id"], transcript["transcript"])
+    print(f"🔎 Indexed {len(transcript['transcript'])} transcript segments for {payload['notetaker_id']}.")
+
+
+# --- Notetaker State Machine ---
+
+# Notetakers only ever move forward through these states. Webhooks can be
+# retried or delivered out of order, so a state is applied only when its rank
+# is higher than the notetaker's current one.
+NOTETAKER_STATE_RANKS = {
+    "scheduled": 0,
+    "connecting": 1,
+    "waiting_for_entry": 2,
+    "attending": 3,
+    "media_processing": 4,
+    "media_available": 5,
+    "failed_entry": 5,
+    "media_error": 5,
+    "media_deleted": 6,
+}
+FAILED_NOTETAKER_STATES = {"failed_entry", "media_error"}
+FINAL_STATE_RANK = 5
+
+# How often the reconciliation job asks Nylas for a notetaker's state in case
+# its webhooks never arrive.
+NOTETAKER_RECONCILE_SECONDS = int(os.getenv("NOTETAKER_RECONCILE_SECONDS", "600"))
+
+
+async def _record_pipeline_failure(payload: dict, error: str):
+    notetaker = await get_notetaker(payload["notetaker_id"])
+    meet_url = notetaker["meet_url"] if notetaker else None
+    await save_media_result(payload["notetaker_id"], meet_url, error=f"Media processing failed: {error}")
+    shutil.rmtree(_work_dir(payload["notetaker_id"]), ignore_errors=True)
+
+@job_handler("process_media", on_dead_letter=_record_pipeline_failure, ready=has_capacity)
+async def run_media_pipeline(payload: dict):
+    """Job handler: processes a notetaker's media once it is available."""
+    notetaker = await get_notetaker(payload["notetaker_id"])
+    if notetaker is None:
+        raise ValueError(f"Notetaker {payload['notetaker_id']} is not tracked.")
+    await process_available_media(notetaker)
+
+async def advance_notetaker(notetaker_id: str, state: str) -> bool:
+    """
+    Applies a notetaker state change and reacts to it: media becoming available
+    queues the media pipeline right away, and a failed state is recorded.
+
+    Returns:
+        True if the state change was applied, False if it was stale, a
+        duplicate, unknown, or for a notetaker we aren't tracking.
+    """
+    state_rank = NOTETAKER_STATE_RANKS.get(state)
+    if state_rank is None:
+        return False
+
+    notetaker = await advance_notetaker_state(notetaker_id, state, state_rank)
+    if notetaker is None:
+        return False
+    print(f"Notetaker state for {notetaker_id}: {state}")
+
+    if state == "media_available":
+        await enqueue(
+            f"media:{notetaker_id}", "process_media", {"notetaker_id": notetaker_id},
+            priority=job_priority(notetaker.get("video_requested", True))
+        )
+    elif state in FAILED_NOTETAKER_STATES:
+        await save_media_result(notetaker_id, notetaker["meet_url"], error=f"Failed with state: {state}")
+    return True
+
+async def watch_notetaker(notetaker_id: str):
+    """Queues the reconciliation job that backs up a new notetaker's webhooks."""
+    await enqueue(
+        f"reconcile:{notetaker_id}", "reconcile_notetaker", {"notetaker_id": notetaker_id},
+        delay_seconds=NOTETAKER_RECONCILE_SECONDS
+    )
+
+@job_handler("reconcile_notetaker")
+async def reconcile_notetaker(payload: dict):
+    """
+    Job handler: reconciliation fallback for a notetaker's webhooks.
+
+    Webhooks normally drive the notetaker through its states. This job only
+    asks Nylas for the state every NOTETAKER_RECONCILE_SECONDS and feeds it
+    into the same state machine, so a missed webhook delays media pickup
+    instead of losing it.
+    """
+    notetaker_id = payload["notetaker_id"]
+    tracked = await get_notetaker(notetaker_id)
+    if tracked is None or tracked["state_rank"] >= FINAL_STATE_RANK:
+        return
+
+    from nylas.models.notetakers import NotetakerState
+
+    notetaker = await find_notetaker(tracked["grant_id"], notetaker_id)
+    current_state = NotetakerState(notetaker.data.state).value
+    await advance_notetaker(notetaker_id, current_state)
+    if NOTETAKER_STATE_RANKS.get(current_state, 0) < FINAL_STATE_RANK:
+        raise RetryLater(NOTETAKER_RECONCILE_SECONDS)
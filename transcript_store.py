@@ -0,0 +1,144 @@
+"""
+Compressed transcript storage in S3 with a per-segment index in MongoDB.
+
+A transcript is stored as newline-delimited JSON segments, gzip-compressed in
+independent blocks of TRANSCRIPT_BLOCK_SEGMENTS segments. Concatenated gzip
+members still form one valid gzip file, so the object can be downloaded and
+decompressed as a whole, but each block can also be fetched on its own with a
+byte-range GET. The Mongo index records every segment's start, end, speaker
+and the byte range of its block, so a time range or a speaker's segments can
+be served by downloading only the blocks that contain them.
+"""
+import os
+import gzip
+import json
+import asyncio
+from database import save_transcript_index, get_transcript_index
+from s3_uploader import upload_file_to_s3, download_from_s3
+
+TRANSCRIPT_BLOCK_SEGMENTS = int(os.getenv("TRANSCRIPT_BLOCK_SEGMENTS", "32"))
+
+
+def transcript_object_name(notetaker_id: str) -> str:
+    return f"recordings/{notetaker_id}/transcript.ndjson.gz"
+
+
+def _split_transcript(transcript_data):
+    """
+    Separates a Nylas transcript into its segments and the remaining
+    top-level fields. Accepts either the `{"transcript": [...]}` document or a
+    bare list of segments.
+    """
+    if isinstance(transcript_data, list):
+        return transcript_data, {}
+    metadata = {key: value for key, value in transcript_data.items() if key != "transcript"}
+    segments = transcript_data.get("transcript") or []
+    if not isinstance(segments, list):
+        # Not diarized: keep the whole text as a single segment.
+        segments = [{"text": segments}]
+    return segments, metadata
+
+
+def encode_transcript(transcript_data) -> tuple:
+    """
+    Compresses a transcript into independently gzipped blocks.
+
+    Returns:
+        A tuple of the compressed bytes, the per-segment index and the
+        transcript's top-level metadata.
+    """
+    segments, metadata = _split_transcript(transcript_data)
+    blocks, index, offset = [], [], 0
+    for block_start in range(0, len(segments), TRANSCRIPT_BLOCK_SEGMENTS):
+        block_segments = segments[block_start:block_start + TRANSCRIPT_BLOCK_SEGMENTS]
+        lines = "".join(json.dumps(segment, ensure_ascii=False) + "\n" for segment in block_segments)
+        block = gzip.compress(lines.encode("utf-8"))
+        for segment in block_segments:
+            index.append({
+                "start": segment.get("start"),
+                "end": segment.get("end"),
+                "speaker": segment.get("speaker"),
+                "offset": offset,
+                "length": len(block),
+            })
+        blocks.append(block)
+        offset += len(block)
+    return b"".join(blocks), index, metadata
+
+
+def _decode_segments(data: bytes) -> list:
+    return [json.loads(line) for line in gzip.decompress(data).decode("utf-8").splitlines() if line]
+
+
+async def store_transcript(notetaker_id: str, transcript_data) -> dict:
+    """
+    Uploads a transcript to S3 and saves its segment index to MongoDB.
+
+    Returns:
+        A small reference to the stored transcript, suitable for embedding in
+        the media result document.
+    """
+    data, index, metadata = await asyncio.to_thread(encode_transcript, transcript_data)
+    object_name = transcript_object_name(notetaker_id)
+    await upload_file_to_s3(data, object_name, "application/gzip")
+
+    speakers = sorted({segment["speaker"] for segment in index if segment["speaker"]})
+    ends = [segment["end"] for segment in index if isinstance(segment["end"], (int, float))]
+    reference = {
+        "key": object_name,
+        "compressed_bytes": len(data),
+        "segment_count": len(index),
+        "speakers": speakers,
+        "duration": max(ends) if ends else None,
+    }
+    await save_transcript_index(notetaker_id, {**reference, "metadata": metadata, "segments": index})
+    return reference
+
+
+async def load_transcript(notetaker_id: str):
+    """Downloads and rebuilds a whole stored transcript, or returns None if there isn't one."""
+    index = await get_transcript_index(notetaker_id, include_segments=False)
+    if index is None:
+        return None
+    segments = await asyncio.to_thread(_decode_segments, await download_from_s3(index["key"]))
+    return {**index.get("metadata", {}), "transcript": segments}
+
+
+def _matches(segment: dict, start_ms, end_ms, speaker) -> bool:
+    if speaker is not None and segment.get("speaker") != speaker:
+        return False
+    # Segments overlapping the requested range are included.
+    if start_ms is not None and segment.get("end") is not None and segment["end"] < start_ms:
+        return False
+    if end_ms is not None and segment.get("start") is not None and segment["start"] > end_ms:
+        return False
+    return True
+
+
+async def read_transcript_segments(notetaker_id: str, start_ms: int = None, end_ms: int = None, speaker: str = None):
+    """
+    Returns only the transcript segments in a time range and/or by a speaker,
+    downloading just the compressed blocks that contain them.
+
+    Returns:
+        The matching segments in order, or None if no transcript is stored.
+    """
+    index = await get_transcript_index(notetaker_id)
+    if index is None:
+        return None
+
+    blocks = sorted({
+        (entry["offset"], entry["length"])
+        for entry in index["segments"]
+        if _matches(entry, start_ms, end_ms, speaker)
+    })
+    block_data = await asyncio.gather(*(
+        download_from_s3(index["key"], byte_range=(offset, offset + length - 1))
+        for offset, length in blocks
+    ))
+
+    segments = []
+    for data in block_data:
+        decoded = await asyncio.to_thread(_decode_segments, data)
+        segments.extend(segment for segment in decoded if _matches(segment, start_ms, end_ms, speaker))
+    return segments
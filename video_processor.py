@@ -1,78 +1,451 @@
 import cv2
 import os
+import json
+import numpy
+import re
 import tempfile
+import statistics
+import subprocess
+from typing import Iterator
 from moviepy import VideoFileClip
+from imageio_ffmpeg import get_ffmpeg_exe
 
-def extract_audio(video_content: bytes) -> bytes:
-    """
-    Extracts the audio from video content.
+# Audio codecs that can be copied out of the container as-is, with the file
+# extension and MIME type of the container they are written to.
+STREAM_COPY_CODECS = {
+    "aac": (".m4a", "audio/mp4"),
+    "mp3": (".mp3", "audio/mpeg"),
+    "opus": (".ogg", "audio/ogg"),
+    "vorbis": (".ogg", "audio/ogg"),
+    "flac": (".flac", "audio/flac"),
+}
+AUDIO_CONTENT_TYPES = {extension: content_type for extension, content_type in STREAM_COPY_CODECS.values()}
 
-    Args:
-        video_content: The binary content of the video file.
+_AUDIO_STREAM_PATTERN = re.compile(r"Stream #\d+:\d+.*?: Audio: (\w+)")
+_PTS_TIME_PATTERN = re.compile(r"pts_time:(-?[\d.]+)")
 
-    Returns:
-        The binary content of the extracted audio file (as mp3).
+# How much of the recording is scanned to measure its keyframe spacing.
+KEYFRAME_PROBE_SECONDS = 300
+
+
+def probe_audio_codec(video_path: str):
+    """
+    Returns the codec name of the first audio stream in a file (e.g. "aac"),
+    or None if it has no audio stream.
     """
-    # Use a temporary file to process the video
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as temp_video_file:
-        temp_video_file.write(video_content)
-        video_path = temp_video_file.name
+    # Without an output file ffmpeg just prints the input's stream info and exits.
+    result = subprocess.run(
+        [get_ffmpeg_exe(), "-hide_banner", "-i", video_path],
+        capture_output=True, text=True
+    )
+    match = _AUDIO_STREAM_PATTERN.search(result.stderr)
+    return match.group(1).lower() if match else None
+
 
+def _copy_audio_stream(video_path: str, audio_path: str):
+    command = [
+        get_ffmpeg_exe(), "-hide_banner", "-loglevel", "error", "-y",
+        "-i", video_path, "-map", "0:a:0", "-vn", "-c:a", "copy",
+    ]
+    if audio_path.endswith(".m4a"):
+        # Put the index up front so players can start streaming immediately.
+        command += ["-movflags", "+faststart"]
+    subprocess.run(command + [audio_path], check=True, capture_output=True)
+
+
+def _transcode_audio(video_path: str, audio_path: str):
+    video_clip = VideoFileClip(video_path)
     try:
-        video_clip = VideoFileClip(video_path)
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as temp_audio_file:
-            audio_path = temp_audio_file.name
-        
         video_clip.audio.write_audiofile(audio_path)
-        video_clip.close()
-        
-        with open(audio_path, "rb") as f:
-            audio_content = f.read()
-
-        # Clean up temporary files
-        os.remove(audio_path)
-        return audio_content
     finally:
-        os.remove(video_path)
+        video_clip.close()
 
 
-def extract_screenshots(video_content: bytes, interval_seconds: int = 10) -> list:
+def extract_audio(video_path: str, output_dir: str = None, stream_copy: bool = True) -> str:
     """
-    Extracts screenshots from a video at a specified interval.
+    Extracts the audio from a video file on disk.
+
+    When the source audio codec can be stored on its own (AAC, MP3, Opus,
+    Vorbis, FLAC), the audio track is demuxed without re-encoding, which takes
+    seconds instead of minutes. Otherwise, or if copying fails, it is
+    transcoded to MP3.
 
     Args:
-        video_content: The binary content of the video file.
-        interval_seconds: The interval in seconds between screenshots.
+        video_path: Path to the downloaded video file.
+        output_dir: Directory to write `audio.<ext>` into. Defaults to a new
+            temporary file.
+        stream_copy: Set to False to always transcode to MP3.
 
     Returns:
-        A list of tuples, where each tuple contains the screenshot's timestamp (in seconds)
-        and its binary content (as JPEG).
-    """
-    screenshots = []
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as temp_video_file:
-        temp_video_file.write(video_content)
-        video_path = temp_video_file.name
-    
+        The path of the extracted audio file; its extension identifies the
+        format (see AUDIO_CONTENT_TYPES). The caller owns the file and is
+        responsible for removing it.
+    """
+    codec = probe_audio_codec(video_path) if stream_copy else None
+    if codec in STREAM_COPY_CODECS:
+        extension = STREAM_COPY_CODECS[codec][0]
+        audio_path = _output_path(output_dir, extension)
+        try:
+            _copy_audio_stream(video_path, audio_path)
+            return audio_path
+        except subprocess.CalledProcessError as e:
+            print(f"⚠️ Stream copy of {codec} audio failed, transcoding instead: {e.stderr}")
+            if os.path.exists(audio_path):
+                os.remove(audio_path)
+
+    audio_path = _output_path(output_dir, ".mp3")
     try:
-        cap = cv2.VideoCapture(video_path)
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        frame_interval = int(fps * interval_seconds)
-        
-        frame_count = 0
-        while cap.isOpened():
+        _transcode_audio(video_path, audio_path)
+        return audio_path
+    except Exception:
+        if os.path.exists(audio_path):
+            os.remove(audio_path)
+        raise
+
+
+def _output_path(output_dir: str, extension: str) -> str:
+    if output_dir:
+        return os.path.join(output_dir, f"audio{extension}")
+    with tempfile.NamedTemporaryFile(delete=False, suffix=extension) as temp_audio_file:
+        return temp_audio_file.name
+
+
+def _timestamps(duration_seconds: float, interval_seconds: int):
+    """Yields the whole-second timestamps at which screenshots should be taken."""
+    timestamp = 0
+    while timestamp < duration_seconds:
+        yield timestamp
+        timestamp += interval_seconds
+
+
+def _encode_jpeg(frame):
+    is_success, buffer = cv2.imencode(".jpg", frame)
+    return buffer.tobytes() if is_success else None
+
+
+def probe_keyframe_interval(video_path: str, probe_seconds: int = KEYFRAME_PROBE_SECONDS):
+    """
+    Returns the typical (median) spacing, in seconds, between the keyframes
+    in the first `probe_seconds` of a video, or None if it can't be measured
+    (fewer than two keyframes). Only keyframes are decoded, so this is cheap.
+    """
+    result = subprocess.run(
+        [
+            get_ffmpeg_exe(), "-hide_banner", "-nostats", "-skip_frame", "nokey",
+            "-t", str(probe_seconds), "-i", video_path,
+            "-map", "0:v:0", "-vf", "showinfo", "-f", "null", "-",
+        ],
+        capture_output=True, text=True
+    )
+    keyframes = sorted(float(pts) for pts in _PTS_TIME_PATTERN.findall(result.stderr))
+    if len(keyframes) < 2:
+        return None
+    return statistics.median(later - earlier for earlier, later in zip(keyframes, keyframes[1:]))
+
+
+def _sampling_mode(video_path: str, interval_seconds: int) -> str:
+    """
+    Picks how to reach frames `interval_seconds` apart. Seeking decodes from
+    the keyframe before each target, so it only beats walking the stream when
+    samples are at least a keyframe interval apart; with meeting recordings'
+    long GOPs (often 10-60 s) dense samples must be walked to instead.
+    """
+    keyframe_seconds = probe_keyframe_interval(video_path)
+    if keyframe_seconds is not None and interval_seconds >= keyframe_seconds:
+        return "seek"
+    return "grab"
+
+
+def _sample_frames(cap, interval_seconds: int, mode: str) -> Iterator[tuple]:
+    """
+    Yields (timestamp_sec, frame) for one decoded frame every `interval_seconds`.
+
+    "seek" jumps straight to each target frame, so only the frames that are
+    kept, plus the run-up from the keyframe before each one, get decoded.
+    "grab" walks the stream with grab() and only retrieve()s the target
+    frames; grab() still decodes every frame, but never one twice. It is also
+    used when the frame count is unknown and seeking isn't reliable.
+    """
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    if not fps or fps <= 0:
+        return
+
+    if mode == "seek" and total_frames > 0:
+        for timestamp_sec in _timestamps(total_frames / fps, interval_seconds):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(timestamp_sec * fps))
             ret, frame = cap.read()
             if not ret:
                 break
-            
-            if frame_count % frame_interval == 0:
-                timestamp_sec = int(frame_count / fps)
-                is_success, buffer = cv2.imencode(".jpg", frame)
-                if is_success:
-                    screenshots.append((timestamp_sec, buffer.tobytes()))
-            
-            frame_count += 1
-            
+            yield timestamp_sec, frame
+        return
+
+    frame_interval = max(int(fps * interval_seconds), 1)
+    frame_count = 0
+    while cap.grab():
+        if frame_count % frame_interval == 0:
+            ret, frame = cap.retrieve()
+            if ret:
+                yield int(frame_count / fps), frame
+        frame_count += 1
+
+
+def extract_screenshots(video_path: str, interval_seconds: int = 10, mode: str = "auto", raw: bool = False) -> Iterator[tuple]:
+    """
+    Extracts screenshots from a video at a specified interval.
+
+    This is a generator: each screenshot is yielded as soon as it is encoded,
+    so callers can upload frames while later ones are still being extracted.
+
+    Args:
+        video_path: Path to the downloaded video file.
+        interval_seconds: The interval in seconds between screenshots.
+        mode: How to reach each screenshot's timestamp, "seek" or "grab"
+            (see `_sample_frames`). "auto" seeks only when screenshots are at
+            least a keyframe interval apart, and walks the stream otherwise.
+        raw: Yield the decoded frame instead of JPEG bytes.
+
+    Yields:
+        Tuples of the screenshot's timestamp (in seconds) and its binary
+        content (as JPEG), or the decoded frame when `raw` is set.
+    """
+    if mode not in ("auto", "seek", "grab"):
+        raise ValueError(f"Unknown screenshot mode: {mode}")
+    if mode == "auto":
+        mode = _sampling_mode(video_path, interval_seconds)
+
+    cap = cv2.VideoCapture(video_path)
+    try:
+        for timestamp_sec, frame in _sample_frames(cap, interval_seconds, mode):
+            img_bytes = frame if raw else _encode_jpeg(frame)
+            if img_bytes is not None:
+                yield timestamp_sec, img_bytes
+    finally:
         cap.release()
-        return screenshots
+
+
+def _frame_signature(frame) -> int:
+    """
+    Computes a 64-bit difference hash of a frame.
+
+    The frame is shrunk to 9x8 greyscale and each bit records whether a pixel
+    is brighter than its right-hand neighbour, so the signature survives
+    compression noise but flips when slides or speakers change.
+    """
+    grey = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(grey, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def extract_scene_changes(
+    video_path: str,
+    sample_seconds: int = 1,
+    min_spacing_seconds: int = 5,
+    max_spacing_seconds: int = 60,
+    threshold: int = 10,
+    raw: bool = False,
+) -> Iterator[tuple]:
+    """
+    Extracts a screenshot each time the picture changes.
+
+    Frames are sampled every `sample_seconds`, by seeking to them when
+    samples are at least a keyframe interval apart and by walking the stream
+    otherwise (see `_sampling_mode`). Each sample is compared to the last emitted screenshot by its difference
+    hash; only samples that differ by more than `threshold` bits are
+    JPEG-encoded and yielded. A static slide therefore produces one
+    screenshot instead of one per interval.
+
+    Args:
+        video_path: Path to the downloaded video file.
+        sample_seconds: How often to sample a frame for comparison.
+        min_spacing_seconds: Minimum time between two screenshots, so rapid
+            changes (e.g. scrolling) don't produce a burst of frames.
+        max_spacing_seconds: Maximum time between two screenshots; a frame is
+            emitted after this long even if nothing changed.
+        threshold: Number of differing signature bits (out of 64) that counts
+            as a scene change.
+        raw: Yield the decoded frame instead of JPEG bytes.
+
+    Yields:
+        Tuples of the screenshot's timestamp (in seconds) and its binary
+        content (as JPEG), or the decoded frame when `raw` is set.
+    """
+    mode = _sampling_mode(video_path, sample_seconds)
+    cap = cv2.VideoCapture(video_path)
+    try:
+        last_signature, last_timestamp = None, None
+        for timestamp_sec, frame in _sample_frames(cap, sample_seconds, mode):
+            signature = _frame_signature(frame)
+
+            if last_signature is None:
+                is_new_scene = True
+            else:
+                elapsed = timestamp_sec - last_timestamp
+                changed = (signature ^ last_signature).bit_count() > threshold
+                is_new_scene = elapsed >= max_spacing_seconds or (elapsed >= min_spacing_seconds and changed)
+
+            if is_new_scene:
+                img_bytes = frame if raw else _encode_jpeg(frame)
+                if img_bytes is not None:
+                    last_signature, last_timestamp = signature, timestamp_sec
+                    yield timestamp_sec, img_bytes
+    finally:
+        cap.release()
+
+
+def _video_duration(video_path: str) -> float:
+    cap = cv2.VideoCapture(video_path)
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        total_frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        return total_frames / fps if fps and fps > 0 and total_frames > 0 else 0
     finally:
-        os.remove(video_path)
\ No newline at end of file
+        cap.release()
+
+
+def _vtt_timestamp(seconds: float) -> str:
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3_600_000)
+    minutes, millis = divmod(millis, 60_000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{millis:03d}"
+
+
+class _SpriteSheetWriter:
+    """
+    Packs thumbnails into fixed-size grids and writes each full grid as one JPEG.
+
+    A meeting with hundreds of screenshots becomes a handful of sprite sheets,
+    and a player can show any thumbnail by cropping the sheet with the
+    coordinates recorded in the index.
+    """
+
+    def __init__(self, output_dir: str, thumb_width: int, columns: int, rows: int):
+        self.output_dir = output_dir
+        self.thumb_width = thumb_width
+        self.thumb_height = None
+        self.columns = columns
+        self.rows = rows
+        self.sheet = None
+        self.sheet_index = 0
+        self.slot = 0
+        self.cues = []
+        self.paths = []
+
+    def add(self, timestamp_sec: int, frame):
+        if self.thumb_height is None:
+            height, width = frame.shape[:2]
+            self.thumb_height = max(int(round(height * self.thumb_width / width)), 1)
+        if self.sheet is None:
+            self.sheet = numpy.zeros(
+                (self.thumb_height * self.rows, self.thumb_width * self.columns, 3), dtype=numpy.uint8
+            )
+
+        x = (self.slot % self.columns) * self.thumb_width
+        y = (self.slot // self.columns) * self.thumb_height
+        self.sheet[y:y + self.thumb_height, x:x + self.thumb_width] = cv2.resize(
+            frame, (self.thumb_width, self.thumb_height), interpolation=cv2.INTER_AREA
+        )
+        self.cues.append({
+            "start": timestamp_sec,
+            "sheet": f"sprite_{self.sheet_index}.jpg",
+            "x": x,
+            "y": y,
+            "w": self.thumb_width,
+            "h": self.thumb_height,
+        })
+
+        self.slot += 1
+        if self.slot == self.columns * self.rows:
+            self.flush()
+
+    def flush(self):
+        if self.sheet is None or self.slot == 0:
+            return
+        # A partly filled last sheet is cropped to the rows it actually uses
+        used_rows = (self.slot + self.columns - 1) // self.columns
+        path = os.path.join(self.output_dir, f"sprite_{self.sheet_index}.jpg")
+        with open(path, "wb") as f:
+            f.write(_encode_jpeg(self.sheet[:used_rows * self.thumb_height]))
+        self.paths.append(path)
+        self.sheet, self.slot = None, 0
+        self.sheet_index += 1
+
+    def write_index(self, duration_seconds: float) -> list:
+        """
+        Writes `thumbnails.vtt` (WebVTT with `#xywh=` media fragments) and
+        `thumbnails.json` describing which sheet region covers each time range.
+        """
+        for cue, next_cue in zip(self.cues, self.cues[1:] + [None]):
+            cue["end"] = next_cue["start"] if next_cue else max(duration_seconds, cue["start"] + 1)
+
+        vtt_lines = ["WEBVTT", ""]
+        for cue in self.cues:
+            vtt_lines.append(f"{_vtt_timestamp(cue['start'])} --> {_vtt_timestamp(cue['end'])}")
+            vtt_lines.append(f"{cue['sheet']}#xywh={cue['x']},{cue['y']},{cue['w']},{cue['h']}")
+            vtt_lines.append("")
+
+        vtt_path = os.path.join(self.output_dir, "thumbnails.vtt")
+        with open(vtt_path, "w") as f:
+            f.write("\n".join(vtt_lines))
+        json_path = os.path.join(self.output_dir, "thumbnails.json")
+        with open(json_path, "w") as f:
+            json.dump({"thumbnails": self.cues}, f)
+        return [vtt_path, json_path]
+
+
+def write_screenshots(
+    video_path: str,
+    output_dir: str,
+    mode: str = "scene",
+    output: str = "sprites",
+    thumb_width: int = 160,
+    sprite_columns: int = 10,
+    sprite_rows: int = 10,
+    **options,
+) -> list:
+    """
+    Extracts screenshots and writes them to `output_dir` as they are produced.
+
+    This is the entry point used by the media worker pool: generators can't be
+    returned across a process boundary, so frames are streamed to disk instead
+    and only their paths are sent back.
+
+    Args:
+        video_path: Path to the downloaded video file.
+        output_dir: Existing directory to write the files into.
+        mode: "scene" for extract_scene_changes, "interval" for extract_screenshots.
+        output: "sprites" packs thumbnails into sprite sheets with a WebVTT and
+            JSON index, "frames" writes one full-resolution JPEG per screenshot,
+            "both" does both.
+        thumb_width: Width of each sprite thumbnail; height keeps the aspect ratio.
+        sprite_columns: Thumbnails per sprite sheet row.
+        sprite_rows: Thumbnail rows per sprite sheet.
+        **options: Keyword arguments for the chosen extractor.
+
+    Returns:
+        A list of the written file paths.
+    """
+    if output not in ("sprites", "frames", "both"):
+        raise ValueError(f"Unknown screenshot output: {output}")
+
+    extractor = extract_scene_changes if mode == "scene" else extract_screenshots
+    sprites = _SpriteSheetWriter(output_dir, thumb_width, sprite_columns, sprite_rows) if output != "frames" else None
+    written = []
+    for timestamp_sec, frame in extractor(video_path, raw=True, **options):
+        if output != "sprites":
+            img_bytes = _encode_jpeg(frame)
+            if img_bytes:
+                path = os.path.join(output_dir, f"screenshot_{timestamp_sec}s.jpg")
+                with open(path, "wb") as f:
+                    f.write(img_bytes)
+                written.append(path)
+        if sprites:
+            sprites.add(timestamp_sec, frame)
+
+    if sprites and sprites.cues:
+        sprites.flush()
+        written.extend(sprites.paths)
+        written.extend(sprites.write_index(_video_duration(video_path)))
+    return written
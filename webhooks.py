@@ -0,0 +1,75 @@
+import os
+import hmac
+import hashlib
+from tasks import advance_notetaker
+from calendar_sync import apply_calendar_webhook
+from database import flag_calendar_sync
+
+NYLAS_WEBHOOK_SECRET = os.getenv("NYLAS_WEBHOOK_SECRET")
+
+# notetaker.media events report the media state on their own scale; map it
+# onto the notetaker states used by the state machine.
+MEDIA_EVENT_STATES = {
+    "processing": "media_processing",
+    "available": "media_available",
+    "error": "media_error",
+    "deleted": "media_deleted",
+}
+
+
+def verify_webhook_signature(raw_body: bytes, signature: str) -> bool:
+    """
+    Checks the X-Nylas-Signature header, a hex HMAC-SHA256 of the raw request
+    body keyed with the webhook secret.
+    """
+    if not NYLAS_WEBHOOK_SECRET or not signature:
+        return False
+    expected = hmac.new(NYLAS_WEBHOOK_SECRET.encode(), raw_body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def notetaker_state_from_event(event: dict):
+    """
+    Extracts the notetaker ID and its new state from a Nylas webhook event.
+
+    Returns:
+        A (notetaker_id, state) tuple, or None if the event isn't a notetaker
+        state change.
+    """
+    event_type = event.get("type", "")
+    notetaker = (event.get("data") or {}).get("object") or {}
+    notetaker_id = notetaker.get("id")
+    state = notetaker.get("state")
+    if not notetaker_id or not state:
+        return None
+
+    if event_type == "notetaker.media":
+        state = MEDIA_EVENT_STATES.get(state)
+        return (notetaker_id, state) if state else None
+    if event_type in ("notetaker.created", "notetaker.updated"):
+        return notetaker_id, state
+    return None
+
+
+CALENDAR_EVENT_TYPES = ("event.created", "event.updated", "event.deleted")
+
+
+async def handle_webhook_event(event: dict):
+    """
+    Routes a verified webhook event: calendar changes go to the calendar sync
+    engine and notetaker events drive the notetaker state machine.
+    """
+    if event.get("type") in CALENDAR_EVENT_TYPES:
+        calendar_event = (event.get("data") or {}).get("object") or {}
+        # The grant's sync engine may run on another replica; flag the grant
+        # so its owner picks the change up with an immediate sync.
+        if not apply_calendar_webhook(event["type"], calendar_event) and calendar_event.get("grant_id"):
+            await flag_calendar_sync(calendar_event["grant_id"])
+        return
+
+    transition = notetaker_state_from_event(event)
+    if transition is None:
+        return
+    notetaker_id, state = transition
+    if not await advance_notetaker(notetaker_id, state):
+        print(f"Ignored webhook {event.get('type')} for {notetaker_id}: stale or untracked state '{state}'.")
@@ -0,0 +1,38 @@
+"""
+Standalone media worker.
+
+Runs the durable job queue without the API, so media processing can be scaled
+out on its own machines:
+
+    python worker.py
+
+Set METRICS_PORT to expose this process's Prometheus metrics over HTTP.
+"""
+import os
+import asyncio
+from prometheus_client import start_http_server
+import tasks  # noqa: F401 -- registers the job handlers
+import retention  # noqa: F401 -- registers the deletion job handlers
+from database import init_database, ensure_indexes
+from job_queue import run_job_worker
+from media_worker import shutdown_media_worker
+from metrics import monitor_event_loop_lag
+
+METRICS_PORT = os.getenv("METRICS_PORT")
+
+
+async def main():
+    if METRICS_PORT:
+        start_http_server(int(METRICS_PORT))
+    init_database()
+    await ensure_indexes()
+    lag_monitor = asyncio.create_task(monitor_event_loop_lag())
+    try:
+        await run_job_worker()
+    finally:
+        lag_monitor.cancel()
+        shutdown_media_worker()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())